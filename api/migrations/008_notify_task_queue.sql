@@ -0,0 +1,23 @@
+-- Migration 008: Notify listeners when enrichment tasks become claimable
+-- Lets /internal/tasks/claim-batch long-poll instead of workers sleeping between empty polls
+
+CREATE OR REPLACE FUNCTION notify_task_queue_pending()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_queue_pending', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Enqueue (ingest, /enrichment/enqueue)
+CREATE TRIGGER trg_task_queue_insert_notify
+AFTER INSERT ON task_queue
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_task_queue_pending();
+
+-- Retry after failure and stale-lease recovery
+CREATE TRIGGER trg_task_queue_pending_notify
+AFTER UPDATE OF status ON task_queue
+FOR EACH ROW
+WHEN (NEW.status = 'pending' AND OLD.status IS DISTINCT FROM 'pending')
+EXECUTE FUNCTION notify_task_queue_pending();
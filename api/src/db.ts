@@ -12,6 +12,15 @@ function getDatabaseUrl(): string | undefined {
   );
 }
 
+function getPoolSetting(name: string, fallback: number): number {
+  const val = process.env[name];
+  if (val) {
+    const parsed = Number.parseInt(val, 10);
+    if (Number.isFinite(parsed) && parsed > 0) return parsed;
+  }
+  return fallback;
+}
+
 let pool: pg.Pool | null = null;
 
 export function getPool(): pg.Pool {
@@ -26,6 +35,13 @@ export function getPool(): pg.Pool {
 
     pool = new Pool({
       connectionString: databaseUrl,
+      // Worker claims and result writes share the pool with query traffic; one
+      // connection is held for the task-claim LISTEN (services/task-notify.ts)
+      max: getPoolSetting("PG_POOL_MAX", 20),
+      idleTimeoutMillis: getPoolSetting("PG_POOL_IDLE_TIMEOUT_MS", 30_000),
+      // Fail fast instead of queueing forever when the pool is exhausted
+      connectionTimeoutMillis: getPoolSetting("PG_POOL_CONNECTION_TIMEOUT_MS", 15_000),
+      keepAlive: true,
     });
   }
   return pool;
@@ -65,6 +81,7 @@ export async function runMigrations(options?: RunMigrationsOptions): Promise<voi
     "005_add_document_summary_levels.sql",
     "006_add_entity_name_lower_index.sql",
     "007_add_temporal_and_mime_indexes.sql",
+    "008_notify_task_queue.sql",
   ];
 
   for (const migrationFile of migrations) {
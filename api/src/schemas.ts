@@ -178,6 +178,31 @@ export const internalTaskClaimSchema = {
   },
 };
 
+export const internalTaskClaimBatchSchema = {
+  body: {
+    type: "object" as const,
+    additionalProperties: false as const,
+    properties: {
+      ...internalTaskClaimSchema.body.properties,
+      maxTasks: {
+        type: "integer" as const,
+        minimum: 1,
+        maximum: 100,
+        default: 1,
+        description: "Maximum number of tasks to claim in one request; defaults to 1.",
+      },
+      waitMs: {
+        type: "integer" as const,
+        minimum: 0,
+        maximum: 30000,
+        default: 0,
+        description:
+          "Long-poll: when no task is available, wait up to this many milliseconds for one to be enqueued.",
+      },
+    },
+  },
+};
+
 export const internalTaskResultSchema = {
   params: {
     type: "object" as const,
@@ -220,6 +245,14 @@ export const internalTaskResultSchema = {
         },
       },
       summary: { type: "string" as const },
+      ...internalTaskClaimSchema.body.properties,
+      claimNext: {
+        type: "integer" as const,
+        minimum: 0,
+        maximum: 100,
+        default: 0,
+        description: "Claim up to this many further tasks in the same request; defaults to 0.",
+      },
     },
   },
 };
@@ -13,6 +13,7 @@ import {
   enrichmentClearSchema,
   graphEntitySchema,
   internalTaskClaimSchema,
+  internalTaskClaimBatchSchema,
   internalTaskResultSchema,
   internalTaskFailSchema,
 } from "./schemas.js";
@@ -22,7 +23,7 @@ import { ingest } from "./services/ingest.js";
 import { query } from "./services/query.js";
 import { getEnrichmentStatus, getEnrichmentStats, enqueueEnrichment, clearEnrichmentQueue } from "./services/enrichment.js";
 import { listCollections } from "./services/collections.js";
-import { claimTask, submitTaskResult, failTask, recoverStaleTasks } from "./services/internal.js";
+import { claimTask, claimTasks, submitTaskResult, failTask, recoverStaleTasks } from "./services/internal.js";
 import { getPool } from "./db.js";
 import { SqlGraphBackend } from "./services/sql-graph-backend.js";
 import { downloadRawBlobStream } from "./blob-store.js";
@@ -332,11 +333,32 @@ export function buildApp() {
     return reply.send(result);
   });
 
+  app.post("/internal/tasks/claim-batch", { schema: internalTaskClaimBatchSchema }, async (req, reply) => {
+    const body = req.body as any;
+    const result = await claimTasks(body);
+    return reply.send(result);
+  });
+
   app.post("/internal/tasks/:id/result", { schema: internalTaskResultSchema }, async (req, reply) => {
     const { id } = req.params as { id: string };
     const body = req.body as any;
     await submitTaskResult(id, body);
-    return reply.send({ ok: true });
+    if (!body.claimNext) {
+      return reply.send({ ok: true });
+    }
+    // Hand the worker its next task in the same round trip. The result is
+    // already committed, so a failed claim must not fail the request.
+    try {
+      const { tasks } = await claimTasks({
+        workerId: body.workerId,
+        leaseDuration: body.leaseDuration,
+        maxTasks: body.claimNext,
+      });
+      return reply.send({ ok: true, tasks });
+    } catch (error) {
+      req.log.warn({ err: error }, "claiming next task after result failed");
+      return reply.send({ ok: true, tasks: [] });
+    }
   });
 
   app.post("/internal/tasks/:id/fail", { schema: internalTaskFailSchema }, async (req, reply) => {
@@ -1,11 +1,12 @@
 import { describe, it, expect, vi, beforeEach } from "vitest";
-import { claimTask, submitTaskResult, failTask, recoverStaleTasks } from "./internal.js";
+import { claimTask, claimTasks, submitTaskResult, failTask, recoverStaleTasks } from "./internal.js";
 
 // Mock the db module
 vi.mock("../db.js", () => ({
   getPool: vi.fn(() => ({
     connect: vi.fn(async () => ({
-      query: vi.fn(async (sql: string) => {
+      query: vi.fn(async (query: string | { text: string }) => {
+        const sql = typeof query === "string" ? query : query.text;
         if (sql.includes("UPDATE task_queue")) {
           return {
             rows: [
@@ -16,7 +17,7 @@ vi.mock("../db.js", () => ({
                   collection: "docs",
                   baseId: "base-id",
                 },
-                attempt: 1,
+                attempt: 2,
               },
             ],
           };
@@ -40,6 +41,21 @@ vi.mock("../db.js", () => ({
   })),
 }));
 
+const taskWait = vi.hoisted(() => ({
+  wait: Promise.resolve(),
+  cancel: vi.fn(),
+  shorten: vi.fn(),
+}));
+
+vi.mock("./task-notify.js", () => ({
+  armTaskWait: vi.fn(async () => taskWait),
+}));
+
+// Named statements are passed as a config object, plain ones as (text, values)
+const queryText = (call: any[]): string => (typeof call[0] === "string" ? call[0] : call[0].text);
+const queryValues = (call: any[]): unknown[] | undefined =>
+  typeof call[0] === "string" ? call[1] : call[0].values;
+
 describe("internal service", () => {
   beforeEach(() => {
     vi.clearAllMocks();
@@ -55,6 +71,29 @@ describe("internal service", () => {
       expect(result.chunks?.length).toBe(2);
     });
 
+    it("uses named prepared statements for the claim queries", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (query: string | { text: string }) =>
+        typeof query === "object" && query.text.includes("UPDATE task_queue")
+          ? { rows: [{ id: "task-123", payload: { baseId: "base-id", collection: "docs" }, attempt: 2 }] }
+          : { rows: [] }
+      );
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      await claimTask({ workerId: "worker-1" });
+
+      const names = mockClientQuery.mock.calls
+        .map((call: any) => call[0])
+        .filter((query: any) => typeof query === "object")
+        .map((query: any) => query.name);
+      expect(names).toEqual(["claim-task", "claim-task-chunks"]);
+    });
+
     it("returns empty object when no tasks available", async () => {
       const { getPool } = await import("../db.js");
       (getPool as any).mockReturnValueOnce({
@@ -76,6 +115,149 @@ describe("internal service", () => {
     });
   });
 
+  describe("claimTasks", () => {
+    it("claims several tasks and fetches their chunks in one query", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (query: string | { text: string; values: unknown[] }) => {
+        if (typeof query === "string") return { rows: [] };
+        if (query.text.includes("UPDATE task_queue")) {
+          return {
+            rows: [
+              // First claims: attempt defaults to 1 and the claim increments it
+              { id: "task-1", payload: { baseId: "doc-a", collection: "docs", chunkIndex: 0 }, attempt: 2 },
+              { id: "task-2", payload: { baseId: "doc-a", collection: "docs", chunkIndex: 1 }, attempt: 2 },
+              { id: "task-3", payload: { baseId: "doc-b", collection: "docs", chunkIndex: 0 }, attempt: 2 },
+            ],
+          };
+        }
+        return {
+          rows: [
+            { base_id: "doc-a", collection: "docs", chunk_index: 0, text: "a0" },
+            { base_id: "doc-a", collection: "docs", chunk_index: 1, text: "a1" },
+            { base_id: "doc-b", collection: "docs", chunk_index: 0, text: "b0" },
+          ],
+        };
+      });
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      const result = await claimTasks({ workerId: "worker-1", maxTasks: 3 });
+
+      expect(result.tasks.map((t) => t.task.id)).toEqual(["task-1", "task-2", "task-3"]);
+      expect(result.tasks[1].chunks.map((c) => c.text)).toEqual(["a0", "a1"]);
+      expect(result.tasks[2].chunks.map((c) => c.text)).toEqual(["b0"]);
+
+      const queries = mockClientQuery.mock.calls
+        .map((call: any) => call[0])
+        .filter((query: any) => typeof query === "object");
+      expect(queries).toHaveLength(2);
+      expect(queries[0].values).toEqual(["worker-1", 300, 3]);
+      // Each claimed document is fetched once
+      expect(queries[1].values).toEqual([["doc-a", "doc-b"], ["docs", "docs"]]);
+      // First deliveries skip the already-enriched check
+      expect(
+        mockClientQuery.mock.calls.some(
+          (call: any) => typeof call[0] === "string" && call[0].includes("c.enriched_at >= t.created_at")
+        )
+      ).toBe(false);
+    });
+
+    it("returns no tasks when the queue is empty", async () => {
+      const { getPool } = await import("../db.js");
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: vi.fn(async () => ({ rows: [] })),
+          release: vi.fn(),
+        })),
+      });
+
+      const result = await claimTasks({ maxTasks: 5 });
+      expect(result.tasks).toEqual([]);
+    });
+
+    it("completes retried tasks whose chunk was already enriched instead of returning them", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (query: string | { text: string; values: unknown[] }) => {
+        if (typeof query === "string") {
+          return query.includes("c.enriched_at >= t.created_at") ? { rows: [{ id: "task-2" }] } : { rows: [] };
+        }
+        if (query.text.includes("UPDATE task_queue")) {
+          return {
+            rows: [
+              // task-1 is a first delivery, task-2 a redelivery
+              { id: "task-1", payload: { baseId: "doc-a", collection: "docs", chunkIndex: 0 }, attempt: 2 },
+              { id: "task-2", payload: { baseId: "doc-b", collection: "docs", chunkIndex: 0 }, attempt: 3 },
+            ],
+          };
+        }
+        return { rows: [{ base_id: "doc-a", collection: "docs", chunk_index: 0, text: "a0" }] };
+      });
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      const result = await claimTasks({ workerId: "worker-1", maxTasks: 2 });
+
+      expect(result.tasks.map((t) => t.task.id)).toEqual(["task-1"]);
+      const dedupeCall = mockClientQuery.mock.calls.find(
+        (call: any) => typeof call[0] === "string" && call[0].includes("c.enriched_at >= t.created_at")
+      );
+      // Only retried tasks are checked
+      expect((dedupeCall as any)[1]).toEqual([["task-2"]]);
+      const chunkQuery = mockClientQuery.mock.calls
+        .map((call: any) => call[0])
+        .find((query: any) => typeof query === "object" && query.name === "claim-tasks-chunks");
+      expect(chunkQuery.values).toEqual([["doc-a"], ["docs"]]);
+    });
+
+    it("long-polls once when waitMs is set and the queue is empty", async () => {
+      const { getPool } = await import("../db.js");
+      const { armTaskWait } = await import("./task-notify.js");
+      const connect = vi.fn(async () => ({
+        query: vi.fn(async () => ({ rows: [] })),
+        release: vi.fn(),
+      }));
+      const pool = { connect, query: vi.fn(async () => ({ rows: [{ ms: null }] })) };
+      // Claim, next-due lookup, claim after the wake-up
+      (getPool as any).mockReturnValueOnce(pool).mockReturnValueOnce(pool).mockReturnValueOnce(pool);
+
+      const result = await claimTasks({ maxTasks: 2, waitMs: 5000 });
+
+      expect(result.tasks).toEqual([]);
+      expect(armTaskWait).toHaveBeenCalledWith(5000);
+      // One claim before waiting and one after the wake-up
+      expect(connect).toHaveBeenCalledTimes(2);
+      // No pending task: the wait keeps its full timeout
+      expect(taskWait.shorten).not.toHaveBeenCalled();
+      expect(taskWait.cancel).toHaveBeenCalled();
+    });
+
+    it("wakes the long-poll when the earliest pending retry comes due", async () => {
+      const { getPool } = await import("../db.js");
+      const connect = vi.fn(async () => ({
+        query: vi.fn(async () => ({ rows: [] })),
+        release: vi.fn(),
+      }));
+      const query = vi.fn(async () => ({ rows: [{ ms: 1500 }] }));
+      const pool = { connect, query };
+      (getPool as any).mockReturnValueOnce(pool).mockReturnValueOnce(pool).mockReturnValueOnce(pool);
+
+      await claimTasks({ maxTasks: 1, waitMs: 20000 });
+
+      const dueQuery = (query.mock.calls[0] as any)[0];
+      expect(dueQuery.text).toContain("min(run_after)");
+      expect(dueQuery.text).toContain("status = 'pending'");
+      expect(taskWait.shorten).toHaveBeenCalledWith(1500);
+    });
+  });
+
   describe("submitTaskResult", () => {
     it("submits enrichment results successfully", async () => {
       await expect(
@@ -92,6 +274,110 @@ describe("internal service", () => {
       ).resolves.not.toThrow();
     });
 
+    it("upserts entities and mentions in a single statement", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (query: string | { text: string }) => {
+        const sql = typeof query === "string" ? query : query.text;
+        if (sql.includes("FROM documents WHERE base_id")) {
+          return { rows: [{ id: "doc-123" }] };
+        }
+        return { rows: [] };
+      });
+
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      await submitTaskResult("task-123", {
+        chunkId: "base-id:0",
+        collection: "docs",
+        entities: [
+          { name: "Entity1", type: "person", description: "First" },
+          { name: "Entity2", type: "org" },
+        ],
+      });
+
+      const entityCalls = mockClientQuery.mock.calls.filter((call: any) =>
+        queryText(call).includes("INSERT INTO entities")
+      );
+      expect(entityCalls).toHaveLength(1);
+      // The document id comes back from the chunk update statement
+      const docLookup = mockClientQuery.mock.calls.filter((call: any) =>
+        queryText(call).includes("FROM documents WHERE base_id")
+      );
+      expect(docLookup).toHaveLength(1);
+      expect(queryText(docLookup[0])).toContain("UPDATE chunks c");
+      expect(queryText(entityCalls[0])).toContain("INSERT INTO document_entity_mentions");
+      expect(queryValues(entityCalls[0])).toEqual([
+        "doc-123",
+        ["Entity1", "Entity2"],
+        ["person", "org"],
+        ["First", null],
+      ]);
+
+      const names = mockClientQuery.mock.calls
+        .map((call: any) => call[0])
+        .filter((query: any) => typeof query === "object")
+        .map((query: any) => query.name);
+      expect(names).toEqual(["submit-result-chunk", "submit-result-entities", "submit-result-complete"]);
+    });
+
+    it("collapses repeated entities and relationships before upserting", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (query: string | { text: string }) => {
+        const sql = typeof query === "string" ? query : query.text;
+        if (sql.includes("FROM documents WHERE base_id")) {
+          return { rows: [{ id: "doc-123" }] };
+        }
+        return { rows: [] };
+      });
+
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      await submitTaskResult("task-123", {
+        chunkId: "base-id:0",
+        collection: "docs",
+        entities: [
+          { name: "Entity1", type: "person" },
+          { name: "Entity2", type: "org" },
+          { name: "Entity1", type: "person", description: "Later description" },
+        ],
+        relationships: [
+          { source: "Entity1", target: "Entity2", type: "works-at" },
+          { source: "Entity1", target: "Entity2", type: "works-at" },
+          { source: "Entity2", target: "Entity1", type: "employs" },
+        ],
+      });
+
+      const entityCall = mockClientQuery.mock.calls.find((call: any) =>
+        queryText(call).includes("INSERT INTO entities")
+      );
+      expect(queryValues(entityCall as any)).toEqual([
+        "doc-123",
+        ["Entity1", "Entity2"],
+        ["person", "org"],
+        ["Later description", null],
+      ]);
+
+      const relationshipCall = mockClientQuery.mock.calls.find((call: any) =>
+        queryText(call).includes("INSERT INTO entity_relationships")
+      );
+      expect(queryValues(relationshipCall as any)).toEqual([
+        ["Entity1", "Entity2"],
+        ["Entity2", "Entity1"],
+        ["works-at", "employs"],
+        [null, null],
+      ]);
+    });
+
     it("validates chunkId format", async () => {
       await expect(
         submitTaskResult("task-123", {
@@ -130,8 +416,9 @@ describe("internal service", () => {
 
     it("stores summaries at document level, omits from chunk tier3_meta", async () => {
       const { getPool } = await import("../db.js");
-      const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("FROM documents WHERE base_id")) {
+      const mockClientQuery = vi.fn(async (query: string | { text: string }) => {
+        const sql = typeof query === "string" ? query : query.text;
+        if (sql.includes("UPDATE documents SET")) {
           return { rows: [{ id: "doc-123" }] };
         }
         return { rows: [] };
@@ -158,16 +445,16 @@ describe("internal service", () => {
 
       // Find the chunk update query
       const chunkUpdateCall = mockClientQuery.mock.calls.find((call: any) =>
-        call[0].includes("UPDATE chunks c")
+        queryText(call).includes("UPDATE chunks c")
       );
       expect(chunkUpdateCall).toBeDefined();
-      expect(chunkUpdateCall![0]).toContain("- 'summary'");
-      expect(chunkUpdateCall![0]).toContain("- 'summary_short'");
-      expect(chunkUpdateCall![0]).toContain("- 'summary_medium'");
-      expect(chunkUpdateCall![0]).toContain("- 'summary_long'");
-      expect(chunkUpdateCall![0]).toContain("- '_error'");
+      expect(queryText(chunkUpdateCall!)).toContain("- 'summary'");
+      expect(queryText(chunkUpdateCall!)).toContain("- 'summary_short'");
+      expect(queryText(chunkUpdateCall!)).toContain("- 'summary_medium'");
+      expect(queryText(chunkUpdateCall!)).toContain("- 'summary_long'");
+      expect(queryText(chunkUpdateCall!)).toContain("- '_error'");
 
-      const chunkUpdateParams = ((chunkUpdateCall as any)?.[1] as unknown[] | undefined) ?? [];
+      const chunkUpdateParams = (queryValues(chunkUpdateCall as any) as unknown[] | undefined) ?? [];
       const chunkTier3PayloadRaw = chunkUpdateParams[1];
       const chunkTier3Payload = JSON.parse(typeof chunkTier3PayloadRaw === "string" ? chunkTier3PayloadRaw : "{}");
       expect(chunkTier3Payload).not.toHaveProperty("summary");
@@ -178,18 +465,26 @@ describe("internal service", () => {
 
       // Find the document update query
       const docUpdateCall = mockClientQuery.mock.calls.find((call: any) =>
-        call[0].includes("UPDATE documents SET")
+        queryText(call).includes("UPDATE documents SET")
       );
       expect(docUpdateCall).toBeDefined();
-      expect(docUpdateCall![0]).toContain("summary_short");
-      expect(docUpdateCall![0]).toContain("summary_medium");
-      expect(docUpdateCall![0]).toContain("summary_long");
+      // Chunk and document updates share a single statement
+      expect(docUpdateCall).toBe(chunkUpdateCall);
+      // ...which also returns the document id for the entity mentions
+      expect(queryText(docUpdateCall!)).toContain("RETURNING id");
+      expect(
+        mockClientQuery.mock.calls.filter((call: any) => queryText(call).includes("SELECT id FROM documents"))
+      ).toHaveLength(0);
+      expect(queryText(docUpdateCall!)).toContain("summary_short");
+      expect(queryText(docUpdateCall!)).toContain("summary_medium");
+      expect(queryText(docUpdateCall!)).toContain("summary_long");
     });
 
     it("uses fallback hierarchy for summary_medium", async () => {
       const { getPool } = await import("../db.js");
-      const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("FROM documents WHERE base_id")) {
+      const mockClientQuery = vi.fn(async (query: string | { text: string }) => {
+        const sql = typeof query === "string" ? query : query.text;
+        if (sql.includes("UPDATE documents SET")) {
           return { rows: [{ id: "doc-123" }] };
         }
         return { rows: [] };
@@ -211,12 +506,12 @@ describe("internal service", () => {
 
       // Find the document update query
       const docUpdateCall = mockClientQuery.mock.calls.find((call: any) =>
-        call[0].includes("UPDATE documents SET")
+        queryText(call).includes("UPDATE documents SET")
       );
       expect(docUpdateCall).toBeDefined();
-      // Verify summary was passed as medium
-      const docUpdateParams = ((docUpdateCall as any)?.[1] as unknown[] | undefined) ?? [];
-      expect(docUpdateParams[1]).toBe("Fallback summary from result.summary");
+      // Verify summary was passed as medium (after the five chunk update params)
+      const docUpdateParams = (queryValues(docUpdateCall as any) as unknown[] | undefined) ?? [];
+      expect(docUpdateParams[6]).toBe("Fallback summary from result.summary");
     });
   });
 
@@ -226,7 +521,7 @@ describe("internal service", () => {
       (getPool as any).mockReturnValueOnce({
         connect: vi.fn(async () => ({
           query: vi.fn(async (sql: string) => {
-            if (sql.includes("SELECT attempt")) {
+            if (sql.includes("RETURNING attempt")) {
               return {
                 rows: [{
                   attempt: 1,
@@ -250,10 +545,10 @@ describe("internal service", () => {
       ).resolves.not.toThrow();
     });
 
-    it("retries with 60-second delay for non-final attempts", async () => {
+    it("retries non-final attempts after a full-jitter backoff capped at 60 seconds", async () => {
       const { getPool } = await import("../db.js");
       const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("SELECT attempt")) {
+        if (sql.includes("RETURNING attempt")) {
           return {
             rows: [{
               attempt: 1,
@@ -278,17 +573,30 @@ describe("internal service", () => {
 
       await failTask("task-123", { error: "Test error" });
 
-      // Find the retry update query
-      const retryCall = mockClientQuery.mock.calls.find((call: any) =>
-        call[0].includes("status = 'pending'") && call[0].includes("interval '60 seconds'")
+      // Retry and dead-letter transitions are one statement that returns the task state
+      const taskUpdateCalls = mockClientQuery.mock.calls.filter((call: any) =>
+        call[0].includes("UPDATE task_queue")
+      );
+      expect(taskUpdateCalls).toHaveLength(1);
+      const sql: string = taskUpdateCalls[0][0];
+      expect(sql).toContain("ELSE 'pending'");
+      expect(taskUpdateCalls[0][1]).toEqual(["Test error", "task-123"]);
+
+      // run_after = now() + random() * min(base^attempt, cap) seconds: uniform
+      // between now and the capped exponential bound
+      const backoff = sql.match(
+        /ELSE now\(\) \+ random\(\) \* LEAST\(power\((\d+), attempt\), (\d+)\) \* interval '1 second'/
       );
-      expect(retryCall).toBeDefined();
+      expect(backoff).not.toBeNull();
+      const [base, cap] = [Number(backoff![1]), Number(backoff![2])];
+      const upperBoundSeconds = (attempt: number) => Math.min(base ** attempt, cap);
+      expect([1, 2, 3, 5, 6, 10].map(upperBoundSeconds)).toEqual([2, 4, 8, 32, 60, 60]);
     });
 
     it("moves to dead letter on final attempt", async () => {
       const { getPool } = await import("../db.js");
       const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("SELECT attempt")) {
+        if (sql.includes("RETURNING attempt")) {
           return {
             rows: [{
               attempt: 3,
@@ -315,16 +623,23 @@ describe("internal service", () => {
 
       // Find the dead-letter update query
       const deadLetterCall = mockClientQuery.mock.calls.find((call: any) =>
-        call[0].includes("status = 'dead'")
+        call[0].includes("THEN 'dead'")
       );
       expect(deadLetterCall).toBeDefined();
-      expect(deadLetterCall![0]).toContain("completed_at = now()");
+      expect(deadLetterCall![0]).toContain("THEN now() ELSE completed_at");
+
+      // The chunk error metadata is flagged as final
+      const chunkUpdateCall = mockClientQuery.mock.calls.find((call: any) =>
+        call[0].includes("UPDATE chunks c SET")
+      );
+      const chunkUpdateParams = ((chunkUpdateCall as any)?.[1] as unknown[] | undefined) ?? [];
+      expect(chunkUpdateParams[7]).toBe(true);
     });
 
     it("records error metadata in chunk tier3_meta", async () => {
       const { getPool } = await import("../db.js");
       const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("SELECT attempt")) {
+        if (sql.includes("RETURNING attempt")) {
           return {
             rows: [{
               attempt: 2,
@@ -362,10 +677,49 @@ describe("internal service", () => {
       expect(chunkUpdateParams[2]).toBe(5);
     });
 
+    it("rejects failure reports for tasks that are no longer processing", async () => {
+      const { getPool } = await import("../db.js");
+      const mockClientQuery = vi.fn(async (sql: string) => {
+        if (sql.includes("SELECT status FROM task_queue")) {
+          return { rows: [{ status: "pending" }] };
+        }
+        return { rows: [] };
+      });
+
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: mockClientQuery,
+          release: vi.fn(),
+        })),
+      });
+
+      const error = await failTask("task-123", { error: "Late report" }).catch((e) => e);
+
+      expect(error.message).toContain("no longer processing (status: pending)");
+      expect(error.statusCode).toBe(409);
+      const taskUpdate = mockClientQuery.mock.calls.find((call: any) => call[0].includes("UPDATE task_queue"));
+      expect(taskUpdate![0]).toContain("AND status = 'processing'");
+      // A re-queued task is neither re-queued again nor marks its chunk failed
+      expect(mockClientQuery.mock.calls.some((call: any) => call[0].includes("UPDATE chunks c SET"))).toBe(false);
+      expect(mockClientQuery).toHaveBeenCalledWith("ROLLBACK");
+    });
+
+    it("throws when the failed task does not exist", async () => {
+      const { getPool } = await import("../db.js");
+      (getPool as any).mockReturnValueOnce({
+        connect: vi.fn(async () => ({
+          query: vi.fn(async () => ({ rows: [] })),
+          release: vi.fn(),
+        })),
+      });
+
+      await expect(failTask("missing", { error: "x" })).rejects.toThrow("Task not found: missing");
+    });
+
     it("parses chunk index from chunkId format", async () => {
       const { getPool } = await import("../db.js");
       const mockClientQuery = vi.fn(async (sql: string) => {
-        if (sql.includes("SELECT attempt")) {
+        if (sql.includes("RETURNING attempt")) {
           return {
             rows: [{
               attempt: 1,
@@ -1,7 +1,9 @@
 // Internal endpoints for worker communication
 // These endpoints allow the worker to claim tasks and submit results
 
+import type pg from "pg";
 import { getPool } from "../db.js";
+import { armTaskWait } from "./task-notify.js";
 
 /**
  * Type-safe non-empty string extraction
@@ -23,6 +25,44 @@ function removeTier3SummaryFields(tier3: Record<string, unknown> | undefined): R
   return Object.keys(rest).length > 0 ? rest : undefined;
 }
 
+type ResultEntity = NonNullable<TaskResultRequest["entities"]>[number];
+type ResultRelationship = NonNullable<TaskResultRequest["relationships"]>[number];
+
+/**
+ * Collapse repeated entities by name, the entities upsert conflict key.
+ * One INSERT ... ON CONFLICT DO UPDATE cannot affect the same row twice,
+ * and LLM output often repeats an entity.
+ */
+function dedupeEntities(entities: ResultEntity[]): ResultEntity[] {
+  const byName = new Map<string, ResultEntity>();
+  for (const entity of entities) {
+    const existing = byName.get(entity.name);
+    if (!existing) {
+      byName.set(entity.name, entity);
+    } else if (!existing.description && entity.description) {
+      byName.set(entity.name, { ...existing, description: entity.description });
+    }
+  }
+  return [...byName.values()];
+}
+
+/**
+ * Collapse repeated relationships by (source, target, type), their upsert conflict key
+ */
+function dedupeRelationships(relationships: ResultRelationship[]): ResultRelationship[] {
+  const byKey = new Map<string, ResultRelationship>();
+  for (const rel of relationships) {
+    const key = JSON.stringify([rel.source, rel.target, rel.type]);
+    const existing = byKey.get(key);
+    if (!existing) {
+      byKey.set(key, rel);
+    } else if (!existing.description && rel.description) {
+      byKey.set(key, { ...existing, description: rel.description });
+    }
+  }
+  return [...byKey.values()];
+}
+
 export interface TaskClaimRequest {
   workerId?: string;
   leaseDuration?: number; // seconds
@@ -40,6 +80,15 @@ export interface TaskClaimResult {
   }>;
 }
 
+export interface TaskClaimBatchRequest extends TaskClaimRequest {
+  maxTasks?: number;
+  waitMs?: number; // milliseconds
+}
+
+export interface TaskClaimBatchResult {
+  tasks: Array<Required<TaskClaimResult>>;
+}
+
 export interface TaskResultRequest {
   chunkId: string;
   collection: string;
@@ -63,6 +112,45 @@ export interface TaskFailRequest {
   error: string;
 }
 
+// task_queue.attempt defaults to 1 and each claim increments it before the row is
+// returned, so a task's first delivery reaches the worker with attempt 2
+const FIRST_CLAIM_ATTEMPT = 2;
+
+/**
+ * Complete retried tasks whose chunk was already enriched after they were
+ * enqueued - an earlier attempt stored its result but the worker never saw the
+ * acknowledgement (lost response, expired lease). Returns the completed IDs so
+ * the caller can drop them instead of handing the same work out again.
+ */
+async function completeAlreadyEnriched(
+  client: pg.PoolClient,
+  tasks: Array<{ id: string; attempt: number }>
+): Promise<Set<string>> {
+  const retriedIds = tasks.filter((task) => task.attempt > FIRST_CLAIM_ATTEMPT).map((task) => task.id);
+  if (retriedIds.length === 0) {
+    return new Set();
+  }
+
+  const result = await client.query<{ id: string }>(
+    `UPDATE task_queue t
+     SET status = 'completed',
+         completed_at = now(),
+         leased_by = NULL,
+         lease_expires_at = NULL
+     FROM chunks c
+     JOIN documents d ON c.document_id = d.id
+     WHERE t.id = ANY($1::uuid[])
+       AND d.base_id = t.payload->>'baseId'
+       AND d.collection = t.payload->>'collection'
+       AND c.chunk_index = (t.payload->>'chunkIndex')::int
+       AND c.enrichment_status = 'enriched'
+       AND c.enriched_at >= t.created_at
+     RETURNING t.id`,
+    [retriedIds]
+  );
+  return new Set(result.rows.map((row) => row.id));
+}
+
 /**
  * Claim next available task from the queue using SKIP LOCKED
  */
@@ -75,13 +163,15 @@ export async function claimTask(request: TaskClaimRequest): Promise<TaskClaimRes
   try {
     await client.query("BEGIN");
 
-    // Dequeue next task with SKIP LOCKED (PostgreSQL 9.5+)
+    // Dequeue next task with SKIP LOCKED (PostgreSQL 9.5+).
+    // Named so each pooled connection parses and plans it once.
     const result = await client.query<{
       id: string;
       payload: Record<string, unknown>;
       attempt: number;
-    }>(
-      `UPDATE task_queue
+    }>({
+      name: "claim-task",
+      text: `UPDATE task_queue
        SET status = 'processing',
            leased_by = $1,
            lease_expires_at = now() + interval '1 second' * $2,
@@ -98,8 +188,8 @@ export async function claimTask(request: TaskClaimRequest): Promise<TaskClaimRes
          FOR UPDATE SKIP LOCKED
        )
        RETURNING id, payload, attempt`,
-      [workerId, leaseDuration]
-    );
+      values: [workerId, leaseDuration],
+    });
 
     if (result.rows.length === 0) {
       await client.query("COMMIT");
@@ -107,17 +197,23 @@ export async function claimTask(request: TaskClaimRequest): Promise<TaskClaimRes
     }
 
     const task = result.rows[0];
+    const alreadyEnriched = await completeAlreadyEnriched(client, result.rows);
+    if (alreadyEnriched.has(task.id)) {
+      await client.query("COMMIT");
+      return {};
+    }
     const payload = task.payload as any;
 
     // Fetch chunk texts for the entire document
-    const chunksResult = await client.query<{ chunk_index: number; text: string }>(
-      `SELECT c.chunk_index, c.text
+    const chunksResult = await client.query<{ chunk_index: number; text: string }>({
+      name: "claim-task-chunks",
+      text: `SELECT c.chunk_index, c.text
        FROM chunks c
        JOIN documents d ON c.document_id = d.id
        WHERE d.base_id = $1 AND d.collection = $2
        ORDER BY c.chunk_index`,
-      [payload.baseId, payload.collection]
-    );
+      values: [payload.baseId, payload.collection],
+    });
 
     await client.query("COMMIT");
 
@@ -140,6 +236,160 @@ export async function claimTask(request: TaskClaimRequest): Promise<TaskClaimRes
   }
 }
 
+/**
+ * Claim up to maxTasks available tasks in one round trip using SKIP LOCKED.
+ * With waitMs, an empty queue is long-polled until a task is enqueued.
+ */
+export async function claimTasks(request: TaskClaimBatchRequest): Promise<TaskClaimBatchResult> {
+  const workerId = request.workerId || "unknown";
+  const leaseDuration = request.leaseDuration || 300; // 5 minutes default
+  const maxTasks = request.maxTasks || 1;
+  const waitMs = request.waitMs || 0;
+
+  if (waitMs <= 0) {
+    return claimTaskBatch(workerId, leaseDuration, maxTasks);
+  }
+
+  const taskWait = await armTaskWait(waitMs);
+  try {
+    const claimed = await claimTaskBatch(workerId, leaseDuration, maxTasks);
+    if (claimed.tasks.length > 0) {
+      return claimed;
+    }
+    // Retries are re-queued with a future run_after and nothing notifies when
+    // it comes due, so wake up no later than the earliest pending task
+    const nextDueMs = await msUntilNextPendingTask();
+    if (nextDueMs !== null) {
+      taskWait.shorten(nextDueMs);
+    }
+    await taskWait.wait;
+    return await claimTaskBatch(workerId, leaseDuration, maxTasks);
+  } finally {
+    taskWait.cancel();
+  }
+}
+
+/**
+ * Milliseconds until the earliest pending task becomes claimable, or null if none is pending
+ */
+async function msUntilNextPendingTask(): Promise<number | null> {
+  const result = await getPool().query<{ ms: number | null }>({
+    name: "next-pending-task",
+    text: `SELECT GREATEST(0, CEIL(EXTRACT(EPOCH FROM (min(run_after) - now())) * 1000))::int AS ms
+       FROM task_queue
+       WHERE queue = 'enrichment' AND status = 'pending'`,
+  });
+  return result.rows[0]?.ms ?? null;
+}
+
+async function claimTaskBatch(
+  workerId: string,
+  leaseDuration: number,
+  maxTasks: number
+): Promise<TaskClaimBatchResult> {
+  const pool = getPool();
+  const client = await pool.connect();
+  try {
+    await client.query("BEGIN");
+
+    const result = await client.query<{
+      id: string;
+      payload: Record<string, unknown>;
+      attempt: number;
+    }>({
+      name: "claim-tasks",
+      text: `UPDATE task_queue
+       SET status = 'processing',
+           leased_by = $1,
+           lease_expires_at = now() + interval '1 second' * $2,
+           started_at = now(),
+           attempt = attempt + 1
+       WHERE id IN (
+         SELECT id
+         FROM task_queue
+         WHERE queue = 'enrichment'
+           AND status = 'pending'
+           AND run_after <= now()
+         ORDER BY run_after, created_at
+         LIMIT $3
+         FOR UPDATE SKIP LOCKED
+       )
+       RETURNING id, payload, attempt`,
+      values: [workerId, leaseDuration, maxTasks],
+    });
+
+    const alreadyEnriched = await completeAlreadyEnriched(client, result.rows);
+    const claimed = result.rows.filter((row) => !alreadyEnriched.has(row.id));
+
+    if (claimed.length === 0) {
+      await client.query("COMMIT");
+      return { tasks: [] }; // No tasks available
+    }
+
+    // Fetch chunk texts for every claimed document in one query
+    const documentKey = (baseId: unknown, collection: unknown) => `${collection}\u0000${baseId}`;
+    const documents = new Map<string, { baseId: string; collection: string }>();
+    for (const row of claimed) {
+      const payload = row.payload as any;
+      documents.set(documentKey(payload.baseId, payload.collection), {
+        baseId: payload.baseId,
+        collection: payload.collection,
+      });
+    }
+
+    const chunksResult = await client.query<{
+      base_id: string;
+      collection: string;
+      chunk_index: number;
+      text: string;
+    }>({
+      name: "claim-tasks-chunks",
+      text: `SELECT d.base_id, d.collection, c.chunk_index, c.text
+       FROM chunks c
+       JOIN documents d ON c.document_id = d.id
+       JOIN UNNEST($1::text[], $2::text[]) AS claimed(base_id, collection)
+         ON d.base_id = claimed.base_id AND d.collection = claimed.collection
+       ORDER BY d.base_id, c.chunk_index`,
+      values: [
+        [...documents.values()].map((doc) => doc.baseId),
+        [...documents.values()].map((doc) => doc.collection),
+      ],
+    });
+
+    await client.query("COMMIT");
+
+    const chunksByDocument = new Map<string, Array<{ chunkIndex: number; text: string }>>();
+    for (const r of chunksResult.rows) {
+      const key = documentKey(r.base_id, r.collection);
+      let chunks = chunksByDocument.get(key);
+      if (!chunks) {
+        chunks = [];
+        chunksByDocument.set(key, chunks);
+      }
+      chunks.push({ chunkIndex: r.chunk_index, text: r.text });
+    }
+
+    return {
+      tasks: claimed.map((task) => {
+        const payload = task.payload as any;
+        return {
+          task: {
+            id: task.id,
+            payload: task.payload,
+            attempt: task.attempt,
+          },
+          chunks: chunksByDocument.get(documentKey(payload.baseId, payload.collection)) ?? [],
+        };
+      }),
+    };
+  } catch (error) {
+    await client.query("ROLLBACK");
+    throw error;
+  } finally {
+    client.release();
+  }
+}
+
 /**
  * Submit enrichment results - writes all data in one transaction
  */
@@ -173,8 +423,7 @@ export async function submitTaskResult(taskId: string, result: TaskResultRequest
     const tier3WithoutSummaries = removeTier3SummaryFields(result.tier3);
 
     // Update chunk with enrichment results (without summaries)
-    await client.query(
-      `UPDATE chunks c
+    const chunkUpdateSql = `UPDATE chunks c
        SET enrichment_status = 'enriched',
            enriched_at = now(),
            tier2_meta = $1,
@@ -190,21 +439,40 @@ export async function submitTaskResult(taskId: string, result: TaskResultRequest
        WHERE c.document_id = d.id
          AND d.base_id = $3
          AND d.collection = $4
-         AND c.chunk_index = $5`,
-      [
-        result.tier2 ? JSON.stringify(result.tier2) : null,
-        tier3WithoutSummaries ? JSON.stringify(tier3WithoutSummaries) : '{}',
-        baseId,
-        result.collection,
-        chunkIndex,
-      ]
-    );
-
-    // Get document_id for entity mentions
-    const docResult = await client.query<{ id: string }>(
-      `SELECT id FROM documents WHERE base_id = $1 AND collection = $2`,
-      [baseId, result.collection]
-    );
+         AND c.chunk_index = $5`;
+    const chunkUpdateParams = [
+      result.tier2 ? JSON.stringify(result.tier2) : null,
+      tier3WithoutSummaries ? JSON.stringify(tier3WithoutSummaries) : '{}',
+      baseId,
+      result.collection,
+      chunkIndex,
+    ];
+
+    // The chunk update and the document_id lookup share one round trip.
+    // Statements on this path are named so each pooled connection parses and
+    // plans them once.
+    let docResult: { rows: { id: string }[] };
+    if (summaryShort || summaryMedium || summaryLong) {
+      docResult = await client.query<{ id: string }>({
+        name: "submit-result-chunk-summaries",
+        text: `WITH updated_chunk AS (${chunkUpdateSql})
+         UPDATE documents SET
+          summary_short = COALESCE($6, summary_short),
+          summary_medium = COALESCE($7, summary_medium),
+          summary_long = COALESCE($8, summary_long),
+          summary = COALESCE($7, summary_medium, summary)
+        WHERE base_id = $3 AND collection = $4
+        RETURNING id`,
+        values: [...chunkUpdateParams, summaryShort, summaryMedium, summaryLong],
+      });
+    } else {
+      docResult = await client.query<{ id: string }>({
+        name: "submit-result-chunk",
+        text: `WITH updated_chunk AS (${chunkUpdateSql})
+         SELECT id FROM documents WHERE base_id = $3 AND collection = $4`,
+        values: chunkUpdateParams,
+      });
+    }
 
     if (docResult.rows.length === 0) {
       throw new Error(`Document not found for baseId: ${baseId}`);
@@ -212,104 +480,70 @@ export async function submitTaskResult(taskId: string, result: TaskResultRequest
 
     const documentId = docResult.rows[0].id;
 
-    // Update document summaries if any are provided
-    if (summaryShort || summaryMedium || summaryLong) {
-      await client.query(
-        `UPDATE documents SET
-          summary_short = COALESCE($1, summary_short),
-          summary_medium = COALESCE($2, summary_medium),
-          summary_long = COALESCE($3, summary_long),
-          summary = COALESCE($2, summary_medium, summary)
-        WHERE base_id = $4 AND collection = $5`,
-        [summaryShort, summaryMedium, summaryLong, baseId, result.collection]
-      );
-    }
-
-    // Batch upsert entities
+    // Upsert entities and record their document mentions in one round trip
     if (result.entities && result.entities.length > 0) {
-      const entityValues: string[] = [];
-      const entityParams: unknown[] = [];
-      let paramIndex = 1;
-
-      for (const entity of result.entities) {
-        entityValues.push(
-          `($${paramIndex}, $${paramIndex + 1}, $${paramIndex + 2})`
-        );
-        entityParams.push(entity.name, entity.type, entity.description || null);
-        paramIndex += 3;
-      }
-
-      await client.query(
-        `INSERT INTO entities (name, type, description)
-         VALUES ${entityValues.join(", ")}
-         ON CONFLICT (name) DO UPDATE
-         SET type = COALESCE(EXCLUDED.type, entities.type),
-             description = COALESCE(EXCLUDED.description, entities.description),
-             mention_count = entities.mention_count + 1,
-             last_seen = now()`,
-        entityParams
-      );
-
-      // Batch create document-entity mentions
-      const mentionValues: string[] = [];
-      const mentionParams: unknown[] = [documentId];
-      paramIndex = 2; // $1 is documentId
-
-      for (const entity of result.entities) {
-        mentionValues.push(`($${paramIndex})`);
-        mentionParams.push(entity.name);
-        paramIndex++;
-      }
-
-      await client.query(
-        `INSERT INTO document_entity_mentions (document_id, entity_id, mention_count)
-         SELECT $1, e.id, 1
-         FROM (VALUES ${mentionValues.join(", ")}) AS names(name)
-         JOIN entities e ON e.name = names.name
+      const entities = dedupeEntities(result.entities);
+      await client.query({
+        name: "submit-result-entities",
+        text: `WITH upserted AS (
+           INSERT INTO entities (name, type, description)
+           SELECT * FROM UNNEST($2::text[], $3::text[], $4::text[])
+           ON CONFLICT (name) DO UPDATE
+           SET type = COALESCE(EXCLUDED.type, entities.type),
+               description = COALESCE(EXCLUDED.description, entities.description),
+               mention_count = entities.mention_count + 1,
+               last_seen = now()
+           RETURNING id
+         )
+         INSERT INTO document_entity_mentions (document_id, entity_id, mention_count)
+         SELECT $1::uuid, upserted.id, 1
+         FROM upserted
          ON CONFLICT (document_id, entity_id) DO UPDATE
          SET mention_count = document_entity_mentions.mention_count + 1`,
-        mentionParams
-      );
+        values: [
+          documentId,
+          entities.map((entity) => entity.name),
+          entities.map((entity) => entity.type),
+          entities.map((entity) => entity.description || null),
+        ],
+      });
     }
 
-    // Batch upsert relationships
+    // Batch upsert relationships; array parameters keep the statement text fixed
     if (result.relationships && result.relationships.length > 0) {
-      const relValues: string[] = [];
-      const relParams: unknown[] = [];
-      let paramIndex = 1;
-
-      for (const rel of result.relationships) {
-        relValues.push(
-          `($${paramIndex}, $${paramIndex + 1}, $${paramIndex + 2}, $${paramIndex + 3})`
-        );
-        relParams.push(rel.source, rel.target, rel.type, rel.description || null);
-        paramIndex += 4;
-      }
-
-      await client.query(
-        `INSERT INTO entity_relationships (source_id, target_id, relationship_type, description)
-         SELECT 
+      const relationships = dedupeRelationships(result.relationships);
+      await client.query({
+        name: "submit-result-relationships",
+        text: `INSERT INTO entity_relationships (source_id, target_id, relationship_type, description)
+         SELECT
            source_entity.id,
            target_entity.id,
            rels.relationship_type,
            rels.description
-         FROM (VALUES ${relValues.join(", ")}) AS rels(source_name, target_name, relationship_type, description)
+         FROM UNNEST($1::text[], $2::text[], $3::text[], $4::text[])
+           AS rels(source_name, target_name, relationship_type, description)
          JOIN entities AS source_entity ON source_entity.name = rels.source_name
          JOIN entities AS target_entity ON target_entity.name = rels.target_name
          ON CONFLICT (source_id, target_id, relationship_type) DO UPDATE
          SET description = COALESCE(EXCLUDED.description, entity_relationships.description)`,
-        relParams
-      );
+        values: [
+          relationships.map((rel) => rel.source),
+          relationships.map((rel) => rel.target),
+          relationships.map((rel) => rel.type),
+          relationships.map((rel) => rel.description || null),
+        ],
+      });
     }
 
     // Mark task as completed
-    await client.query(
-      `UPDATE task_queue
+    await client.query({
+      name: "submit-result-complete",
+      text: `UPDATE task_queue
        SET status = 'completed',
            completed_at = now()
        WHERE id = $1`,
-      [taskId]
-    );
+      values: [taskId],
+    });
 
     await client.query("COMMIT");
   } catch (error) {
@@ -330,18 +564,47 @@ export async function failTask(taskId: string, failRequest: TaskFailRequest): Pr
   try {
     await client.query("BEGIN");
 
-    // Get current task state and payload
+    // Move to dead-letter (dead status) on the final attempt, otherwise retry
+    // after a full-jitter backoff (uniform in [0, min(2^attempt, 60)] seconds) so
+    // tasks that failed together do not retry together; return the task state
+    // in the same round trip. Only a task still being processed can fail: a
+    // report for one that already completed or was re-queued is rejected
+    // with 409 rather than applied twice.
     const taskResult = await client.query<{
       attempt: number;
       max_attempts: number;
       payload: Record<string, unknown>;
     }>(
-      `SELECT attempt, max_attempts, payload FROM task_queue WHERE id = $1`,
-      [taskId]
+      `UPDATE task_queue
+       SET status = CASE WHEN attempt >= max_attempts THEN 'dead' ELSE 'pending' END,
+           error = $1,
+           completed_at = CASE WHEN attempt >= max_attempts THEN now() ELSE completed_at END,
+           run_after = CASE
+             WHEN attempt >= max_attempts THEN run_after
+             ELSE now() + random() * LEAST(power(2, attempt), 60) * interval '1 second'
+           END,
+           leased_by = CASE WHEN attempt >= max_attempts THEN leased_by ELSE NULL END,
+           lease_expires_at = CASE WHEN attempt >= max_attempts THEN lease_expires_at ELSE NULL END
+       WHERE id = $2 AND status = 'processing'
+       RETURNING attempt, max_attempts, payload`,
+      [failRequest.error, taskId]
     );
 
     if (taskResult.rows.length === 0) {
-      throw new Error(`Task not found: ${taskId}`);
+      const existing = await client.query<{ status: string }>(
+        "SELECT status FROM task_queue WHERE id = $1",
+        [taskId]
+      );
+      if (existing.rows.length === 0) {
+        throw new Error(`Task not found: ${taskId}`);
+      }
+      // Typically the lease expired and stale-lease recovery already re-queued
+      // the task; report the lost failure instead of dropping it silently
+      const error = new Error(
+        `Task ${taskId} is no longer processing (status: ${existing.rows[0].status}); failure not recorded`
+      ) as Error & { statusCode?: number };
+      error.statusCode = 409;
+      throw error;
     }
 
     const { attempt, max_attempts, payload } = taskResult.rows[0];
@@ -396,30 +659,6 @@ export async function failTask(taskId: string, failRequest: TaskFailRequest): Pr
       );
     }
 
-    if (isFinal) {
-      // Move to dead-letter (dead status)
-      await client.query(
-        `UPDATE task_queue
-         SET status = 'dead',
-             error = $1,
-             completed_at = now()
-         WHERE id = $2`,
-        [failRequest.error, taskId]
-      );
-    } else {
-      // Retry with 60-second delay
-      await client.query(
-        `UPDATE task_queue
-         SET status = 'pending',
-             error = $1,
-             run_after = now() + interval '60 seconds',
-             leased_by = NULL,
-             lease_expires_at = NULL
-         WHERE id = $2`,
-        [failRequest.error, taskId]
-      );
-    }
-
     await client.query("COMMIT");
   } catch (error) {
     await client.query("ROLLBACK");
@@ -435,7 +674,8 @@ export async function failTask(taskId: string, failRequest: TaskFailRequest): Pr
 export async function recoverStaleTasks(): Promise<{ recovered: number }> {
   const pool = getPool();
 
-  const result = await pool.query<{ count: number }>(
+  // rowCount comes from the command tag; no rows need to be returned
+  const result = await pool.query(
     `UPDATE task_queue
      SET status = 'pending',
          leased_by = NULL,
@@ -443,8 +683,7 @@ export async function recoverStaleTasks(): Promise<{ recovered: number }> {
          run_after = now()
      WHERE queue = 'enrichment'
        AND status = 'processing'
-       AND lease_expires_at < now()
-     RETURNING id`
+       AND lease_expires_at < now()`
   );
 
   return { recovered: result.rowCount || 0 };
@@ -0,0 +1,120 @@
+import { EventEmitter } from "events";
+import { describe, it, expect, vi, beforeEach, afterEach } from "vitest";
+
+const db = vi.hoisted(() => ({
+  clients: [] as any[],
+  connect: vi.fn(),
+}));
+
+vi.mock("../db.js", () => ({
+  getPool: vi.fn(() => ({ connect: db.connect })),
+}));
+
+function makeClient() {
+  const client = Object.assign(new EventEmitter(), {
+    query: vi.fn(async () => ({ rows: [] })),
+    release: vi.fn(),
+  });
+  db.clients.push(client);
+  return client;
+}
+
+async function loadModule() {
+  vi.resetModules();
+  return import("./task-notify.js");
+}
+
+describe("task-notify", () => {
+  beforeEach(() => {
+    db.clients = [];
+    db.connect.mockReset();
+    db.connect.mockImplementation(async () => makeClient());
+  });
+
+  afterEach(() => {
+    vi.useRealTimers();
+  });
+
+  it("LISTENs on one pooled connection shared by every wait", async () => {
+    const { armTaskWait } = await loadModule();
+
+    const first = await armTaskWait(1000);
+    const second = await armTaskWait(1000);
+    first.cancel();
+    second.cancel();
+
+    expect(db.connect).toHaveBeenCalledTimes(1);
+    expect(db.clients[0].query).toHaveBeenCalledWith("LISTEN task_queue_pending");
+  });
+
+  it("wakes every armed wait on a notification", async () => {
+    const { armTaskWait } = await loadModule();
+
+    const first = await armTaskWait(60_000);
+    const second = await armTaskWait(60_000);
+    db.clients[0].emit("notification", { channel: "task_queue_pending" });
+
+    await expect(Promise.all([first.wait, second.wait])).resolves.toBeDefined();
+  });
+
+  it("resolves after the timeout without a notification", async () => {
+    const { armTaskWait } = await loadModule();
+    vi.useFakeTimers();
+
+    const taskWait = await armTaskWait(5000);
+    let resolved = false;
+    taskWait.wait.then(() => {
+      resolved = true;
+    });
+
+    await vi.advanceTimersByTimeAsync(4999);
+    expect(resolved).toBe(false);
+    await vi.advanceTimersByTimeAsync(1);
+    expect(resolved).toBe(true);
+  });
+
+  it("cancel resolves the wait and clears its timer", async () => {
+    const { armTaskWait } = await loadModule();
+    vi.useFakeTimers();
+
+    const taskWait = await armTaskWait(60_000);
+    taskWait.cancel();
+    await taskWait.wait;
+    // A finished wait is not re-armed by a later shorten
+    taskWait.shorten(10);
+
+    expect(vi.getTimerCount()).toBe(0);
+  });
+
+  it("shorten only ever brings the deadline forward", async () => {
+    const { armTaskWait } = await loadModule();
+    vi.useFakeTimers();
+
+    const taskWait = await armTaskWait(20_000);
+    let resolved = false;
+    taskWait.wait.then(() => {
+      resolved = true;
+    });
+
+    taskWait.shorten(1500);
+    taskWait.shorten(10_000);
+    await vi.advanceTimersByTimeAsync(1499);
+    expect(resolved).toBe(false);
+    await vi.advanceTimersByTimeAsync(1);
+    expect(resolved).toBe(true);
+  });
+
+  it("drops a broken listener, wakes waiters and reconnects on next use", async () => {
+    const { armTaskWait } = await loadModule();
+
+    const taskWait = await armTaskWait(60_000);
+    db.clients[0].emit("error", new Error("connection lost"));
+    await taskWait.wait;
+
+    expect(db.clients[0].release).toHaveBeenCalledWith(true);
+
+    const next = await armTaskWait(1000);
+    next.cancel();
+    expect(db.connect).toHaveBeenCalledTimes(2);
+  });
+});
@@ -0,0 +1,82 @@
+// Wake-ups for long-polling task claims
+// A single pooled connection LISTENs for task_queue_pending (see migration 008).
+// It is checked out of the pg pool for the life of the process once the first
+// long-poll arrives, so PG_POOL_MAX must leave room for it.
+
+import type pg from "pg";
+import { getPool } from "../db.js";
+
+const CHANNEL = "task_queue_pending";
+
+let listener: Promise<pg.PoolClient> | null = null;
+const waiters = new Set<() => void>();
+
+function wakeAll(): void {
+  for (const wake of [...waiters]) {
+    wake();
+  }
+}
+
+function ensureListener(): Promise<pg.PoolClient> {
+  if (!listener) {
+    const connecting = (async () => {
+      const client = await getPool().connect();
+      client.on("notification", wakeAll);
+      client.on("error", () => {
+        // Reconnect on next use; wake waiters so they fall back to polling
+        listener = null;
+        client.release(true);
+        wakeAll();
+      });
+      await client.query(`LISTEN ${CHANNEL}`);
+      return client;
+    })();
+    connecting.catch(() => {
+      listener = null;
+    });
+    listener = connecting;
+  }
+  return listener;
+}
+
+export interface TaskWait {
+  wait: Promise<void>;
+  cancel: () => void;
+  /** Resolve by timeoutMs from now if that is sooner than the current deadline */
+  shorten: (timeoutMs: number) => void;
+}
+
+/**
+ * Start waiting for a task to become claimable.
+ *
+ * Arm before querying the queue so a notification that arrives between an
+ * empty claim and the wait is not lost. The wait resolves on the next
+ * notification or after timeoutMs, whichever comes first.
+ */
+export async function armTaskWait(timeoutMs: number): Promise<TaskWait> {
+  await ensureListener();
+
+  let done!: () => void;
+  let timer: ReturnType<typeof setTimeout>;
+  let deadline = Date.now() + timeoutMs;
+  const wait = new Promise<void>((resolve) => {
+    timer = setTimeout(() => done(), timeoutMs);
+    done = () => {
+      clearTimeout(timer);
+      waiters.delete(done);
+      resolve();
+    };
+    waiters.add(done);
+  });
+
+  const shorten = (ms: number) => {
+    const next = Date.now() + Math.max(0, ms);
+    if (next < deadline && waiters.has(done)) {
+      deadline = next;
+      clearTimeout(timer);
+      timer = setTimeout(() => done(), Math.max(0, ms));
+    }
+  };
+
+  return { wait, cancel: () => done(), shorten };
+}
@@ -0,0 +1,7 @@
+import os
+
+# Tier-2 NLP already runs in parallel worker threads/processes; native math
+# libraries spawning a thread per core inside each of them oversubscribes the
+# CPU. Set before anything imports numpy/spaCy; explicit settings still win.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
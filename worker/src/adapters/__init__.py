@@ -1,15 +1,49 @@
 """Adapter factory and exports."""
 
+import importlib
+
 from src.adapters.base import ExtractorAdapter, ImageDescription
 from src.config import EXTRACTOR_PROVIDER
 
+# Provider adapters import their SDK, so they are only loaded on first access
+_LAZY_ADAPTERS = {
+    "AnthropicAdapter": "src.adapters.anthropic",
+    "OllamaAdapter": "src.adapters.ollama",
+    "OpenAIAdapter": "src.adapters.openai",
+}
+
+
+# Shared adapter; its HTTP clients belong to the event loop it was first used on
+_adapter: ExtractorAdapter | None = None
+
 
 def get_adapter() -> ExtractorAdapter:
     """Get the configured LLM adapter.
 
+    The instance is created on first use and shared, so its client pool,
+    response cache and concurrency limit apply process-wide until
+    reset_adapter is called.
+
     Returns:
         ExtractorAdapter instance based on EXTRACTOR_PROVIDER config
     """
+    global _adapter
+    if _adapter is None:
+        _adapter = _create_adapter()
+    return _adapter
+
+
+def reset_adapter() -> None:
+    """Drop the shared adapter so the next get_adapter call builds a new one.
+
+    Call after closing the adapter, once its event loop is done with it.
+    """
+    global _adapter
+    _adapter = None
+
+
+def _create_adapter() -> ExtractorAdapter:
+    """Build the adapter selected by EXTRACTOR_PROVIDER."""
     if EXTRACTOR_PROVIDER == "anthropic":
         from src.adapters.anthropic import AnthropicAdapter
 
@@ -25,4 +59,12 @@ def get_adapter() -> ExtractorAdapter:
         return OllamaAdapter()
 
 
-__all__ = ["ExtractorAdapter", "ImageDescription", "get_adapter"]
+def __getattr__(name: str):
+    """Import provider adapter classes on first attribute access (PEP 562)."""
+    if name in _LAZY_ADAPTERS:
+        return getattr(importlib.import_module(_LAZY_ADAPTERS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Provider classes stay out of __all__ so a star import does not load every SDK
+__all__ = ["ExtractorAdapter", "ImageDescription", "get_adapter", "reset_adapter"]
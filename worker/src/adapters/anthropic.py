@@ -1,110 +1,223 @@
 """Anthropic adapter for LLM extraction."""
 
-import json
+import asyncio
 import logging
-
-from src.adapters.base import ExtractorAdapter, ImageDescription
+import re
+
+import httpx
+
+from src.adapters.base import (
+    FUSED_ENTITY_INSTRUCTIONS,
+    ExtractorAdapter,
+    ImageDescription,
+    first_json_object,
+    fused_extraction_schema,
+    schema_for_prompt,
+    split_fused_result,
+)
+from src.adapters.cache import make_cache_key
 from src.config import (
     ANTHROPIC_API_KEY,
     ANTHROPIC_MODEL_CAPABLE,
     ANTHROPIC_MODEL_FAST,
+    EXTRACTOR_FUSED,
     EXTRACTOR_MAX_OUTPUT_TOKENS,
+    LLM_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    PARALLEL_TOOL_CALLS,
 )
+from src.schemas import schema_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Stands in for the document inside prompt templates; the text itself is sent
+# as the user message so the instructions form a cacheable prefix.
+_TEXT_REFERENCE = "(provided in the user message)"
+
+# Fallback object extraction when the image description is not JSON
+_OBJECT_WORD_RE = re.compile(r"\b[A-Za-z][A-Za-z-]{3,}\b")
+_OBJECT_STOPWORDS = frozenset(
+    {
+        "also",
+        "appears",
+        "detected",
+        "from",
+        "image",
+        "include",
+        "includes",
+        "main",
+        "object",
+        "objects",
+        "some",
+        "that",
+        "there",
+        "these",
+        "this",
+        "visible",
+        "which",
+        "with",
+    }
+)
+_MAX_DETECTED_OBJECTS = 50
+
+_ENTITY_INSTRUCTIONS = """Extract entities and relationships from the text in the user message.
+
+For each entity, identify:
+- name: entity name
+- type: entity type (person, class, concept, project, org, etc.)
+- description: brief description
+
+For each relationship between entities:
+- source: source entity name
+- target: target entity name
+- type: relationship type (uses, depends-on, discusses, implements, etc.)
+- description: brief description
+
+Extract all entities and relationships you can identify."""
+
+_ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "type": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["name", "type", "description"],
+            },
+        },
+        "relationships": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "target": {"type": "string"},
+                    "type": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["source", "target", "type"],
+            },
+        },
+    },
+    "required": ["entities", "relationships"],
+}
+_ENTITY_SCHEMA_JSON = schema_cache_key(_ENTITY_SCHEMA)
+
 
 class AnthropicAdapter(ExtractorAdapter):
     """Anthropic Claude-based LLM extraction adapter."""
 
+    # Claude downsamples anything larger before it reaches the model
+    max_image_dim = 1568
+
     def __init__(self):
+        super().__init__()
         if not ANTHROPIC_API_KEY:
             raise ValueError("ANTHROPIC_API_KEY environment variable is required")
 
-        from anthropic import AsyncAnthropic
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 
-        self.client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        # Multiplex concurrent requests over HTTP/2 on a pool sized to the semaphore
+        http_client = DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=LLM_CONCURRENCY,
+                max_keepalive_connections=LLM_CONCURRENCY,
+            ),
+        )
+        self.client = AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY, http_client=http_client, max_retries=LLM_MAX_RETRIES
+        )
         self.fast_model = ANTHROPIC_MODEL_FAST
         self.capable_model = ANTHROPIC_MODEL_CAPABLE
         self.max_tokens = EXTRACTOR_MAX_OUTPUT_TOKENS
+        self._prompt_cache: dict[tuple[str, str, bytes], str] = {}
 
     async def extract_metadata(
-        self, text: str, doc_type: str, schema: dict, prompt_template: str = ""
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
     ) -> dict:
         """Extract type-specific metadata using Claude."""
-        # Use custom prompt template if provided, otherwise use generic prompt
-        if prompt_template:
-            prompt = prompt_template.replace("{text}", text[:8000]).replace(
-                "{schema}", json.dumps(schema, indent=2)
-            )
-        else:
-            prompt = (
-                f"Analyze this {doc_type} document and extract metadata "
-                f"according to the provided schema.\n\n"
-                f"Text:\n{text[:8000]}\n\n"
-                f"Extract the metadata and provide it as structured JSON."
-            )
-
+        schema_json = schema_json or schema_cache_key(schema)
+        instructions = self._metadata_instructions(doc_type, schema, schema_json, prompt_template)
         return await self._extract_with_tools(
-            prompt, schema, "metadata_extraction", self.fast_model
+            instructions,
+            self._truncate_to_tokens(text, self.fast_model),
+            schema,
+            schema_json,
+            "metadata_extraction",
+            self.fast_model,
         )
 
+    def _metadata_instructions(
+        self, doc_type: str, schema: dict, schema_json: bytes, prompt_template: str
+    ) -> str:
+        """Build the document-independent metadata instructions for the system prompt.
+
+        Memoized per (doc_type, template, schema) so the schema is dumped once.
+        """
+        key = (doc_type, prompt_template, schema_json)
+        instructions = self._prompt_cache.get(key)
+        if instructions is None:
+            # Use custom prompt template if provided, otherwise use generic prompt
+            if prompt_template:
+                instructions = prompt_template.replace("{text}", _TEXT_REFERENCE).replace(
+                    "{schema}", schema_for_prompt(schema)
+                )
+            else:
+                instructions = (
+                    f"Analyze the {doc_type} document in the user message and extract metadata "
+                    f"according to the provided schema.\n\n"
+                    f"Extract the metadata and provide it as structured JSON."
+                )
+            self._prompt_cache[key] = instructions
+        return instructions
+
     async def extract_entities(self, text: str) -> dict:
         """Extract entities and relationships using Claude."""
-        prompt = f"""Extract entities and relationships from this text.
-
-Text:
-{text[:8000]}
-
-For each entity, identify:
-- name: entity name
-- type: entity type (person, class, concept, project, org, etc.)
-- description: brief description
-
-For each relationship between entities:
-- source: source entity name
-- target: target entity name
-- type: relationship type (uses, depends-on, discusses, implements, etc.)
-- description: brief description
-
-Extract all entities and relationships you can identify."""
-
-        schema = {
-            "type": "object",
-            "properties": {
-                "entities": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "name": {"type": "string"},
-                            "type": {"type": "string"},
-                            "description": {"type": "string"},
-                        },
-                        "required": ["name", "type", "description"],
-                    },
-                },
-                "relationships": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "source": {"type": "string"},
-                            "target": {"type": "string"},
-                            "type": {"type": "string"},
-                            "description": {"type": "string"},
-                        },
-                        "required": ["source", "target", "type"],
-                    },
-                },
-            },
-            "required": ["entities", "relationships"],
-        }
-
         return await self._extract_with_tools(
-            prompt, schema, "entity_extraction", self.capable_model
+            _ENTITY_INSTRUCTIONS,
+            self._truncate_to_tokens(text, self.capable_model),
+            _ENTITY_SCHEMA,
+            _ENTITY_SCHEMA_JSON,
+            "entity_extraction",
+            self.capable_model,
         )
 
+    async def extract_all(
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
+    ) -> tuple[dict, dict]:
+        """Extract metadata and entities in one capable-model request when EXTRACTOR_FUSED."""
+        if not EXTRACTOR_FUSED:
+            return await super().extract_all(text, doc_type, schema, prompt_template, schema_json)
+        fused_schema = fused_extraction_schema(schema, _ENTITY_SCHEMA)
+        result = await self._extract_with_tools(
+            self._metadata_instructions(
+                doc_type, schema, schema_json or schema_cache_key(schema), prompt_template
+            )
+            + FUSED_ENTITY_INSTRUCTIONS,
+            self._truncate_to_tokens(text, self.capable_model),
+            fused_schema,
+            schema_cache_key(fused_schema),
+            "document_extraction",
+            self.capable_model,
+        )
+        return split_fused_result(result)
+
     async def describe_image(self, image_base64: str, context: str = "") -> ImageDescription:
         """Describe an image using Claude's vision capabilities."""
         prompt = f"""Describe this image in detail. Provide:
@@ -115,38 +228,60 @@ Extract all entities and relationships you can identify."""
 
 {f"Context: {context}" if context else ""}"""
 
-        try:
-            message = await self.client.messages.create(
-                model=self.capable_model,  # Vision requires capable model
-                max_tokens=self.max_tokens,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": image_base64,
+        cache_key = make_cache_key(self.capable_model, prompt, image_base64)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            # Cached entries were validated when stored
+            return ImageDescription.model_construct(**cached)
+
+        return await self._singleflight(
+            cache_key, lambda: self._request_image_description(prompt, image_base64, cache_key)
+        )
+
+    async def _request_image_description(
+        self, prompt: str, image_base64: str, cache_key: str
+    ) -> ImageDescription:
+        """Call the vision model and parse its description."""
+        stored = await self._load_image_description(cache_key)
+        if stored is not None:
+            return stored
+
+        image_base64, media_type = await asyncio.to_thread(self._prepare_image, image_base64)
+        async with self._semaphore:
+            try:
+                message = await self.client.messages.create(
+                    model=self.capable_model,  # Vision requires capable model
+                    max_tokens=self.max_tokens,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "image",
+                                    "source": {
+                                        "type": "base64",
+                                        "media_type": media_type,
+                                        "data": image_base64,
+                                    },
                                 },
-                            },
-                            {"type": "text", "text": prompt},
-                        ],
-                    }
-                ],
-            )
+                                {"type": "text", "text": prompt},
+                            ],
+                        }
+                    ],
+                )
 
-            # Parse the response
-            response_text = message.content[0].text
+                # Parse the response
+                response_text = message.content[0].text
 
-            # Try to extract structured data from response
-            result = self._parse_image_description(response_text)
-            return ImageDescription(**result)
+                # Try to extract structured data from response
+                result = self._parse_image_description(response_text)
+                description = ImageDescription.model_validate(result)
+                await self._store_image_description(cache_key, description)
+                return description
 
-        except Exception as e:
-            logger.error(f"Error in image description: {e}")
-            return ImageDescription(description="", detected_objects=[], ocr_text="", image_type="")
+            except Exception as e:
+                logger.error("Error in image description: %s", e)
+                return ImageDescription.empty()
 
     async def is_available(self) -> bool:
         """Check if Anthropic API is available."""
@@ -159,55 +294,113 @@ Extract all entities and relationships you can identify."""
             )
             return True
         except Exception as e:
-            logger.warning(f"Anthropic availability check failed: {e}")
+            logger.warning("Anthropic availability check failed: %s", e)
             return False
 
     async def _extract_with_tools(
-        self, prompt: str, schema: dict, tool_name: str, model: str
+        self,
+        instructions: str,
+        text: str,
+        schema: dict,
+        schema_json: bytes,
+        tool_name: str,
+        model: str,
     ) -> dict:
         """Extract structured data using Claude's tool use."""
-        try:
-            message = await self.client.messages.create(
-                model=model,
-                max_tokens=self.max_tokens,
-                tools=[
-                    {
-                        "name": tool_name,
-                        "description": f"Extract structured data for {tool_name}",
-                        "input_schema": schema,
-                    }
-                ],
-                messages=[{"role": "user", "content": prompt}],
-            )
-
-            # Extract tool use from response
-            for content in message.content:
-                if content.type == "tool_use":
-                    return content.input
-
-            # No tool use found, return empty
-            logger.warning(f"No tool use in response for {tool_name}")
-            return self._empty_response_for_schema(schema)
+        cache_key = make_cache_key(model, instructions, text, schema_json)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        return await self._singleflight(
+            cache_key,
+            lambda: self._request_with_tools(
+                instructions, text, schema, schema_json, tool_name, model, cache_key
+            ),
+        )
 
-        except Exception as e:
-            logger.error(f"Error in structured extraction: {e}")
-            return self._empty_response_for_schema(schema)
+    async def _request_with_tools(
+        self,
+        instructions: str,
+        text: str,
+        schema: dict,
+        schema_json: bytes,
+        tool_name: str,
+        model: str,
+        cache_key: str,
+    ) -> dict:
+        """Call Claude with the extraction tool and return its validated input."""
+        async with self._semaphore:
+            try:
+                message = await self.client.messages.create(
+                    **self._tool_request_params(instructions, text, schema, tool_name, model)
+                )
+                logger.debug(
+                    "%s usage: cache_read_input_tokens=%s cache_creation_input_tokens=%s",
+                    tool_name,
+                    message.usage.cache_read_input_tokens,
+                    message.usage.cache_creation_input_tokens,
+                )
+
+                # Extract tool use from response
+                for content in message.content:
+                    if content.type == "tool_use":
+                        if not self._matches_schema(content.input, schema_json):
+                            break
+                        self._cache.set(cache_key, content.input)
+                        return content.input
+                else:
+                    # No tool use found, return empty
+                    logger.warning("No tool use in response for %s", tool_name)
+
+                return self._empty_response_for_schema(schema_json)
+
+            except Exception as e:
+                logger.error("Error in structured extraction: %s", e)
+                return self._empty_response_for_schema(schema_json)
+
+    def _tool_request_params(
+        self, instructions: str, text: str, schema: dict, tool_name: str, model: str
+    ) -> dict:
+        """Build messages.create parameters for a single tool-use extraction.
+
+        The tool definition and instructions are identical across documents, so
+        the system block carries a cache breakpoint and only the text varies.
+        Prefixes below the model's minimum cacheable length are simply not cached.
+        """
+        params = {
+            "model": model,
+            "max_tokens": self.max_tokens,
+            "tools": [
+                {
+                    "name": tool_name,
+                    "description": f"Extract structured data for {tool_name}",
+                    "input_schema": schema,
+                }
+            ],
+            "system": [
+                {
+                    "type": "text",
+                    "text": instructions,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+            "messages": [{"role": "user", "content": text}],
+        }
+        if PARALLEL_TOOL_CALLS is not None:
+            params["tool_choice"] = {
+                "type": "auto",
+                "disable_parallel_tool_use": not PARALLEL_TOOL_CALLS,
+            }
+        return params
 
     def _parse_image_description(self, text: str) -> dict:
         """Parse image description from Claude's response text."""
         # Try to find JSON in the response
-        try:
-            # Look for JSON block
-            start = text.find("{")
-            end = text.rfind("}") + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                return json.loads(json_str)
-        except Exception:
-            logger.debug(
-                "Failed to parse image description as JSON; falling back to heuristic parsing",
-                exc_info=True,
-            )
+        parsed = first_json_object(text)
+        if parsed is not None:
+            return parsed
+        logger.debug("Image description is not JSON; falling back to heuristic parsing")
 
         # Fallback: parse from structured text
         result = {
@@ -217,29 +410,16 @@ Extract all entities and relationships you can identify."""
             "image_type": "",
         }
 
-        # Try to extract objects mentioned
-        if "objects" in text.lower() or "visible" in text.lower():
-            # Simple heuristic extraction
-            lines = text.split("\n")
-            for line in lines:
-                if "object" in line.lower() or "visible" in line.lower():
-                    # Extract words that might be objects
-                    words = line.split()
-                    result["detected_objects"].extend(
-                        [w.strip(",.:-") for w in words if len(w) > 3]
-                    )
-
-        return result
+        # Simple heuristic: words from lines that talk about objects
+        object_lines = "\n".join(
+            line
+            for line in text.splitlines()
+            if "object" in line.lower() or "visible" in line.lower()
+        )
+        words = (match.group(0) for match in _OBJECT_WORD_RE.finditer(object_lines))
+        # dict.fromkeys dedupes while keeping first-mention order
+        result["detected_objects"] = list(
+            dict.fromkeys(w for w in words if w.lower() not in _OBJECT_STOPWORDS)
+        )[:_MAX_DETECTED_OBJECTS]
 
-    def _empty_response_for_schema(self, schema: dict) -> dict:
-        """Generate an empty response matching the schema structure."""
-        result = {}
-        if "properties" in schema:
-            for key, prop in schema["properties"].items():
-                if prop.get("type") == "array":
-                    result[key] = []
-                elif prop.get("type") == "string":
-                    result[key] = ""
-                elif prop.get("type") == "object":
-                    result[key] = {}
         return result
@@ -1,9 +1,182 @@
 """Base adapter interface for LLM extraction."""
 
+import asyncio
+import base64
+import copy
+import functools
+import io
+import json
+import logging
 from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
 
+import fastjsonschema
+import orjson
+import tiktoken
+from PIL import Image
 from pydantic import BaseModel, Field
 
+from src.adapters.cache import DiskCache, ResponseCache
+from src.config import (
+    EXTRACTOR_MAX_INPUT_TOKENS,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_ENTRIES,
+    LLM_CACHE_SIZE,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_CONCURRENCY,
+    PRETTY_SCHEMA,
+)
+
+logger = logging.getLogger(__name__)
+
+# Image formats every vision provider accepts as-is
+_VISION_FORMATS = frozenset({"JPEG", "PNG", "GIF", "WEBP"})
+
+T = TypeVar("T")
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_validator(schema_json: bytes):
+    """Compile a JSON Schema validator once per schema.
+
+    Keyed by canonical JSON because dicts are unhashable. Defaults are not
+    injected so validation never alters the LLM response.
+    """
+    return fastjsonschema.compile(orjson.loads(schema_json), use_default=False)
+
+
+@functools.lru_cache(maxsize=16)
+def _encoding_for_model(model: str) -> tiktoken.Encoding | None:
+    """Resolve the tokenizer for a model, or None if it cannot be loaded.
+
+    Models tiktoken does not know (Ollama, Claude) are approximated with o200k_base.
+    """
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = "o200k_base"
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning("Tokenizer %s unavailable (%s); truncating by characters", name, e)
+        return None
+
+
+def _empty_object(schema: dict) -> dict:
+    """Build the zero value for an object schema, recursing into nested objects."""
+    result = {}
+    for key, prop in schema.get("properties", {}).items():
+        prop_type = prop.get("type")
+        if prop_type == "array":
+            result[key] = []
+        elif prop_type == "string":
+            result[key] = ""
+        elif prop_type == "object":
+            result[key] = _empty_object(prop)
+    return result
+
+
+@functools.lru_cache(maxsize=64)
+def _empty_template(schema_json: bytes) -> bytes:
+    """Serialized empty response for a schema, built once per canonical schema."""
+    return orjson.dumps(_empty_object(orjson.loads(schema_json)))
+
+
+def _trim_schema(node: object) -> object:
+    """Drop title/description annotations from a schema, keeping property names intact."""
+    if isinstance(node, list):
+        return [_trim_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    trimmed = {}
+    for key, value in node.items():
+        if key in ("title", "description"):
+            continue
+        if key in ("properties", "$defs"):
+            trimmed[key] = {name: _trim_schema(sub) for name, sub in value.items()}
+        else:
+            trimmed[key] = _trim_schema(value)
+    return trimmed
+
+
+def schema_for_prompt(schema: dict) -> str:
+    """Serialize a schema for embedding in a prompt.
+
+    Compact JSON without annotations costs well under half the tokens of the
+    indented dump; PRETTY_SCHEMA restores the full indented form for debugging.
+    Validation always uses the full schema.
+    """
+    if PRETTY_SCHEMA:
+        return orjson.dumps(schema, option=orjson.OPT_INDENT_2).decode()
+    return orjson.dumps(_trim_schema(schema)).decode()
+
+
+FUSED_ENTITY_INSTRUCTIONS = """
+
+In the same response, also extract entities and relationships from the text.
+
+For each entity, provide:
+- name: entity name
+- type: entity type (person, class, concept, project, org, etc.)
+- description: brief description
+
+For each relationship between entities:
+- source: source entity name
+- target: target entity name
+- type: relationship type (uses, depends-on, discusses, implements, etc.)
+- description: brief description
+
+Respond with a single JSON object with the keys "metadata" (the metadata described \
+above), "entities" and "relationships"."""
+
+
+def fused_extraction_schema(schema: dict, entity_schema: dict) -> dict:
+    """Combine a metadata schema and the entity schema into one response schema.
+
+    The metadata schema's $defs move to the root so its #/$defs refs still resolve.
+    """
+    fused = {
+        "type": "object",
+        "properties": {
+            "metadata": {key: value for key, value in schema.items() if key != "$defs"},
+            **entity_schema["properties"],
+        },
+        "required": ["metadata", *entity_schema["required"]],
+    }
+    if "$defs" in schema:
+        fused["$defs"] = schema["$defs"]
+    return fused
+
+
+def split_fused_result(result: dict) -> tuple[dict, dict]:
+    """Split a fused extraction result into (metadata, entity_result)."""
+    return result.get("metadata") or {}, {
+        "entities": result.get("entities") or [],
+        "relationships": result.get("relationships") or [],
+    }
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def first_json_object(text: str) -> dict | None:
+    """Return the first well-formed JSON object embedded in text.
+
+    Tolerates surrounding prose and further brace-delimited regions that a
+    first-"{"-to-last-"}" slice would swallow.
+    """
+    start = text.find("{")
+    while start >= 0:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, start)
+        except ValueError:
+            value = None
+        if isinstance(value, dict):
+            return value
+        start = text.find("{", start + 1)
+    return None
+
 
 class ImageDescription(BaseModel):
     """Result of image description extraction."""
@@ -13,13 +186,39 @@ class ImageDescription(BaseModel):
     ocr_text: str = ""
     image_type: str = ""  # photo, diagram, screenshot, chart
 
+    @classmethod
+    def empty(cls) -> "ImageDescription":
+        """Build the blank description returned when the model gives nothing usable."""
+        # Constant fields need no validation
+        return cls.model_construct(description="", detected_objects=[], ocr_text="", image_type="")
+
 
 class ExtractorAdapter(ABC):
     """Abstract base class for LLM extraction adapters."""
 
+    # Longest image side worth uploading; larger images are downscaled first
+    max_image_dim = 2048
+
+    def __init__(self):
+        # Bounds concurrent provider requests so fan-out stays within rate limits
+        self._semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+        # Re-enqueued or duplicated chunks repeat identical prompts
+        self._cache = ResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL_SECONDS)
+        # Vision calls are costly and images recur across documents; keep them on disk
+        self._image_cache = (
+            DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_ENTRIES) if IMAGE_CACHE_DIR else None
+        )
+        # One pending provider call per cache key; concurrent duplicates await it
+        self._inflight: dict[str, asyncio.Future] = {}
+
     @abstractmethod
     async def extract_metadata(
-        self, text: str, doc_type: str, schema: dict, prompt_template: str = ""
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
     ) -> dict:
         """Extract type-specific metadata using the fast model.
 
@@ -28,6 +227,8 @@ class ExtractorAdapter(ABC):
             doc_type: Document type (code, slack, email, etc.)
             schema: JSON schema for the expected output
             prompt_template: Optional prompt template from schema module
+            schema_json: Canonical serialization of schema from the schema module;
+                computed with schema_cache_key when omitted
 
         Returns:
             Extracted metadata as a dictionary
@@ -46,6 +247,50 @@ class ExtractorAdapter(ABC):
         """
         pass
 
+    async def extract_all(
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
+    ) -> tuple[dict, dict]:
+        """Extract metadata and entities/relationships for one document.
+
+        Adapters that can ask for both in a single request override this; the
+        default makes the two calls concurrently and keeps whichever half
+        succeeded, raising only when both fail.
+
+        Args:
+            text: Text to analyze
+            doc_type: Document type (code, slack, email, etc.)
+            schema: JSON schema for the metadata
+            prompt_template: Optional prompt template from schema module
+            schema_json: Canonical serialization of schema from the schema module;
+                computed with schema_cache_key when omitted
+
+        Returns:
+            Tuple of (metadata, dictionary with 'entities' and 'relationships' lists)
+        """
+        metadata, entity_result = await asyncio.gather(
+            self.extract_metadata(text, doc_type, schema, prompt_template, schema_json),
+            self.extract_entities(text),
+            return_exceptions=True,
+        )
+        # Cancellation and other non-Exception errors always propagate
+        for result in (metadata, entity_result):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        if isinstance(metadata, Exception) and isinstance(entity_result, Exception):
+            raise metadata
+        if isinstance(metadata, Exception):
+            logger.warning("Metadata extraction failed for %s document: %s", doc_type, metadata)
+            metadata = {}
+        if isinstance(entity_result, Exception):
+            logger.warning("Entity extraction failed for %s document: %s", doc_type, entity_result)
+            entity_result = {}
+        return metadata, entity_result
+
     @abstractmethod
     async def describe_image(self, image_base64: str, context: str = "") -> ImageDescription:
         """Describe an image using the vision model.
@@ -67,3 +312,115 @@ class ExtractorAdapter(ABC):
             True if available, False otherwise
         """
         pass
+
+    async def aclose(self) -> None:
+        """Close the provider client and release its pooled connections."""
+        await self.client.close()
+        if self._image_cache is not None:
+            self._image_cache.close()
+
+    async def _load_image_description(self, key: str) -> ImageDescription | None:
+        """Look up a description in the persistent image cache."""
+        if self._image_cache is None:
+            return None
+        cached = await asyncio.to_thread(self._image_cache.get, key)
+        if cached is None:
+            return None
+        self._cache.set(key, cached)
+        return ImageDescription.model_construct(**cached)
+
+    async def _store_image_description(self, key: str, description: ImageDescription) -> None:
+        """Remember a description in the response cache and the persistent image cache."""
+        value = description.model_dump()
+        self._cache.set(key, value)
+        if self._image_cache is not None:
+            await asyncio.to_thread(self._image_cache.set, key, value)
+
+    def _truncate_to_tokens(self, text: str, model: str) -> str:
+        """Truncate document text to EXTRACTOR_MAX_INPUT_TOKENS tokens of model."""
+        max_tokens = EXTRACTOR_MAX_INPUT_TOKENS
+        encoding = _encoding_for_model(model)
+        if encoding is None:
+            # Roughly four characters per token for English text
+            return text[: max_tokens * 4]
+        # Only tokenize a prefix; no token is anywhere near 16 characters on average
+        prefix = text[: max_tokens * 16]
+        tokens = encoding.encode(prefix, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return prefix
+        return encoding.decode(tokens[:max_tokens])
+
+    def _prepare_image(self, image_base64: str, quality: int = 85) -> tuple[str, str]:
+        """Downscale an image larger than max_image_dim before upload.
+
+        Images within bounds in a format the vision APIs accept are returned
+        unchanged. Downscaled JPEGs stay JPEG; anything else is re-encoded as
+        lossless PNG so transparency and sharp text edges survive. Undecodable
+        input is returned unchanged. CPU-bound; call via asyncio.to_thread.
+
+        Returns:
+            Tuple of (base64 image data, media type)
+        """
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+            if image.format in _VISION_FORMATS and max(image.size) <= self.max_image_dim:
+                return image_base64, Image.MIME[image.format]
+            image.thumbnail((self.max_image_dim, self.max_image_dim), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            if image.format == "JPEG":
+                image.save(buffer, "JPEG", quality=quality, optimize=True)
+                media_type = "image/jpeg"
+            else:
+                image.save(buffer, "PNG", optimize=True)
+                media_type = "image/png"
+        except Exception as e:
+            logger.warning("Could not re-encode image (%s); sending it unchanged", e)
+            return image_base64, "image/jpeg"
+        return base64.b64encode(buffer.getvalue()).decode(), media_type
+
+    def _empty_response_for_schema(self, schema_json: bytes) -> dict:
+        """Generate an empty response matching the structure of a serialized schema."""
+        return orjson.loads(_empty_template(schema_json))
+
+    def _matches_schema(self, result: dict, schema_json: bytes) -> bool:
+        """Check an LLM response against the serialized JSON schema it was asked to follow."""
+        validator = _compile_validator(schema_json)
+        try:
+            validator(result)
+        except fastjsonschema.JsonSchemaValueException as e:
+            logger.warning("LLM response does not match schema: %s", e.message)
+            return False
+        return True
+
+    async def _singleflight(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """Collapse concurrent identical requests into a single provider call.
+
+        The first caller for a key runs call; callers arriving while it is in
+        flight await the same result and receive their own copy of it. If the
+        leading caller is cancelled, a waiting caller takes over the call.
+        """
+        while (pending := self._inflight.get(key)) is not None:
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                # Only the leader was cancelled, not this caller
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unshared failure is not logged as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
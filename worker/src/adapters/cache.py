@@ -0,0 +1,115 @@
+"""Response caches for LLM adapters."""
+
+import copy
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import orjson
+
+
+def make_cache_key(*parts: str | bytes | dict) -> str:
+    """Hash request parts into a compact cache key.
+
+    Dict parts are serialized with sorted keys so equivalent schemas hash equally;
+    bytes parts, such as an already serialized schema, are hashed as given.
+
+    Args:
+        parts: Model name, prompt text, schema, etc.
+
+    Returns:
+        Hex digest identifying the request
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, dict):
+            digest.update(orjson.dumps(part, option=orjson.OPT_SORT_KEYS))
+        elif isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU cache whose entries expire after a fixed TTL.
+
+    Values are deep-copied on the way in and out because callers normalize
+    extraction results in place.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        """Return a copy of the cached value, or None on a miss or expired entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a copy of value, evicting the least recently used entry when full."""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class DiskCache:
+    """Persistent key/value cache in a SQLite file, bounded by entry count.
+
+    Survives worker restarts, so results that are expensive to recompute (vision
+    calls) are paid once per distinct input. Blocking; call via asyncio.to_thread.
+    """
+
+    def __init__(self, directory: str, max_entries: int):
+        os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "cache.sqlite3"), check_same_thread=False
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Any | None:
+        """Return the stored value, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return None if row is None else orjson.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store value, dropping the oldest entries beyond max_entries."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -1,7 +1,9 @@
 """Ollama adapter for LLM extraction."""
 
+import httpx
+
 from src.adapters.openai import OpenAIAdapter
-from src.config import OLLAMA_API_KEY, OLLAMA_URL, OPENAI_API_KEY
+from src.config import LLM_CONCURRENCY, OLLAMA_API_KEY, OLLAMA_URL, OPENAI_API_KEY
 
 
 def _normalize_ollama_base_url(url: str) -> str:
@@ -22,8 +24,20 @@ class OllamaAdapter(OpenAIAdapter):
     """Ollama-based LLM extraction adapter (thin OpenAI-compatible wrapper)."""
 
     def __init__(self):
+        from openai import DefaultAsyncHttpxClient
+
         api_key = OLLAMA_API_KEY or OPENAI_API_KEY or "not-required"
+        # Keep a warm connection for every request the semaphore lets through; local
+        # generations take seconds, so the SDK's 5s keep-alive expiry would drop them.
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_CONCURRENCY,
+                max_keepalive_connections=LLM_CONCURRENCY,
+                keepalive_expiry=60.0,
+            )
+        )
         super().__init__(
             base_url=_normalize_ollama_base_url(OLLAMA_URL),
             api_key=api_key,
+            http_client=http_client,
         )
@@ -1,27 +1,167 @@
 """OpenAI adapter for LLM extraction."""
 
-import json
+import asyncio
+import functools
 import logging
 import re
 
-from src.adapters.base import ExtractorAdapter, ImageDescription
+import httpx
+import openai
+import orjson
+
+from src.adapters.base import (
+    FUSED_ENTITY_INSTRUCTIONS,
+    ExtractorAdapter,
+    ImageDescription,
+    first_json_object,
+    fused_extraction_schema,
+    schema_for_prompt,
+    split_fused_result,
+)
+from src.adapters.cache import make_cache_key
 from src.config import (
+    EXTRACTOR_FUSED,
     EXTRACTOR_MAX_OUTPUT_TOKENS,
     EXTRACTOR_MODEL_CAPABLE,
     EXTRACTOR_MODEL_FAST,
     EXTRACTOR_MODEL_VISION,
+    LLM_CONCURRENCY,
+    LLM_MAX_RETRIES,
     OPENAI_API_KEY,
     OPENAI_BASE_URL,
 )
+from src.schemas import schema_cache_key
 
 logger = logging.getLogger(__name__)
 
+_SYSTEM_PROMPT = (
+    "You are a helpful assistant that extracts structured data. Always respond with valid JSON."
+)
+
+
+def _is_permanent_failure(error: Exception) -> bool:
+    """Whether a failed request is pointless to re-send without response_format.
+
+    The SDK already retries connection errors, 408/409/429 and 5xx with
+    jittered backoff (honouring Retry-After), so an API error reaching us is
+    final unless the request itself was rejected (400/422), which a plainer
+    request may fix.
+    """
+    if isinstance(error, (openai.BadRequestError, openai.UnprocessableEntityError)):
+        return False
+    return isinstance(error, openai.APIError)
+
+
+@functools.lru_cache(maxsize=128)
+def _strict_json_schema(schema_json: bytes) -> dict:
+    """Rewrite a JSON schema into the subset accepted by strict structured outputs.
+
+    Every object gets additionalProperties: false and lists all of its properties
+    as required; $refs with sibling keys are inlined and null defaults dropped.
+    Keyed by canonical JSON because dicts are unhashable.
+    """
+    root = orjson.loads(schema_json)
+
+    def strict(node: dict) -> dict:
+        for name, sub in node.get("$defs", {}).items():
+            node["$defs"][name] = strict(sub)
+        if node.get("type") == "object":
+            node.setdefault("additionalProperties", False)
+        if isinstance(node.get("properties"), dict):
+            node["required"] = list(node["properties"])
+            node["properties"] = {k: strict(v) for k, v in node["properties"].items()}
+        if isinstance(node.get("items"), dict):
+            node["items"] = strict(node["items"])
+        for key in ("anyOf", "allOf"):
+            if isinstance(node.get(key), list):
+                node[key] = [strict(variant) for variant in node[key]]
+        if "default" in node and node["default"] is None:
+            del node["default"]
+        ref = node.get("$ref")
+        if ref and len(node) > 1:
+            resolved = root
+            for part in ref.removeprefix("#/").split("/"):
+                resolved = resolved[part]
+            node = strict({**resolved, **{k: v for k, v in node.items() if k != "$ref"}})
+        return node
+
+    return strict(root)
+
+
+def _json_schema_response_format(schema_json: bytes) -> dict:
+    """Build a strict json_schema response_format for a serialized schema."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "extraction",
+            "schema": _strict_json_schema(schema_json),
+            "strict": True,
+        },
+    }
+
+
+_ENTITY_PROMPT = """Extract entities and relationships from this text.
+
+Text:
+{text}
+
+For each entity, provide:
+- name: entity name
+- type: entity type (person, class, concept, project, org, etc.)
+- description: brief description
+
+For each relationship:
+- source: source entity name
+- target: target entity name
+- type: relationship type (uses, depends-on, discusses, implements, etc.)
+- description: brief description"""
+_ENTITY_PROMPT_HEAD, _, _ENTITY_PROMPT_TAIL = _ENTITY_PROMPT.partition("{text}")
+
+_ENTITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "type": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["name", "type", "description"],
+            },
+        },
+        "relationships": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "target": {"type": "string"},
+                    "type": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["source", "target", "type"],
+            },
+        },
+    },
+    "required": ["entities", "relationships"],
+}
+_ENTITY_SCHEMA_JSON = schema_cache_key(_ENTITY_SCHEMA)
+
 
 class OpenAIAdapter(ExtractorAdapter):
     """OpenAI GPT-based LLM extraction adapter."""
 
-    def __init__(self, base_url: str | None = None, api_key: str | None = None):
-        from openai import AsyncOpenAI
+    def __init__(
+        self,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        http_client: httpx.AsyncClient | None = None,
+    ):
+        super().__init__()
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
         resolved_base_url = base_url or OPENAI_BASE_URL
         resolved_api_key = api_key or OPENAI_API_KEY or "not-required"
@@ -37,85 +177,115 @@ class OpenAIAdapter(ExtractorAdapter):
                 "Set OPENAI_API_KEY or configure a local OPENAI_BASE_URL."
             )
 
+        if http_client is None:
+            # Multiplex concurrent requests over HTTP/2 where the endpoint offers it (TLS)
+            http_client = DefaultAsyncHttpxClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=LLM_CONCURRENCY,
+                    max_keepalive_connections=LLM_CONCURRENCY,
+                ),
+            )
+
         self.client = AsyncOpenAI(
             base_url=resolved_base_url,
             api_key=resolved_api_key,
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES,
         )
         self.fast_model = EXTRACTOR_MODEL_FAST
         self.capable_model = EXTRACTOR_MODEL_CAPABLE
         self.vision_model = EXTRACTOR_MODEL_VISION
         self.max_tokens = EXTRACTOR_MAX_OUTPUT_TOKENS
+        self._prompt_cache: dict[tuple[str, str, bytes], tuple[str, str, str]] = {}
 
     async def extract_metadata(
-        self, text: str, doc_type: str, schema: dict, prompt_template: str = ""
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
     ) -> dict:
         """Extract type-specific metadata using GPT."""
-        if prompt_template:
-            prompt = prompt_template.replace("{text}", text[:8000]).replace(
-                "{schema}", json.dumps(schema, indent=2)
-            )
-        else:
-            prompt = (
-                f"Analyze this {doc_type} document and extract metadata "
-                f"according to the schema.\n\n"
-                f"Text:\n{text[:8000]}\n\n"
-                f"Schema:\n{json.dumps(schema, indent=2)}\n\n"
-                f"Extract the metadata as JSON."
-            )
-
-        return await self._extract_structured(prompt, schema, self.fast_model)
+        schema_json = schema_json or schema_cache_key(schema)
+        prompt = self._metadata_prompt(text, doc_type, schema, schema_json, prompt_template)
+        return await self._extract_structured(prompt, schema_json, self.fast_model)
+
+    def _metadata_prompt(
+        self, text: str, doc_type: str, schema: dict, schema_json: bytes, prompt_template: str
+    ) -> str:
+        """Build the metadata extraction prompt for a single document."""
+        head, placeholder, tail = self._metadata_skeleton(
+            doc_type, schema, schema_json, prompt_template
+        )
+        if not placeholder:
+            return head
+        return head + self._truncate_to_tokens(text, self.fast_model) + tail
+
+    def _metadata_skeleton(
+        self, doc_type: str, schema: dict, schema_json: bytes, prompt_template: str
+    ) -> tuple[str, str, str]:
+        """Render the document-independent part of the metadata prompt.
+
+        Memoized per (doc_type, template, schema) so the indented schema dump is
+        produced once. Returned pre-split around the {text} placeholder, as
+        str.partition does, so building a prompt is plain concatenation instead
+        of a scan over the rendered template.
+        """
+        key = (doc_type, prompt_template, schema_json)
+        skeleton = self._prompt_cache.get(key)
+        if skeleton is None:
+            schema_text = schema_for_prompt(schema)
+            if prompt_template:
+                rendered = prompt_template.replace("{schema}", schema_text)
+            else:
+                rendered = (
+                    f"Analyze this {doc_type} document and extract metadata "
+                    f"according to the schema.\n\n"
+                    f"Text:\n{{text}}\n\n"
+                    f"Schema:\n{schema_text}\n\n"
+                    f"Extract the metadata as JSON."
+                )
+            skeleton = rendered.partition("{text}")
+            self._prompt_cache[key] = skeleton
+        return skeleton
 
     async def extract_entities(self, text: str) -> dict:
         """Extract entities and relationships using GPT."""
-        prompt = f"""Extract entities and relationships from this text.
-
-Text:
-{text[:8000]}
-
-For each entity, provide:
-- name: entity name
-- type: entity type (person, class, concept, project, org, etc.)
-- description: brief description
-
-For each relationship:
-- source: source entity name
-- target: target entity name
-- type: relationship type (uses, depends-on, discusses, implements, etc.)
-- description: brief description"""
-
-        schema = {
-            "type": "object",
-            "properties": {
-                "entities": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "name": {"type": "string"},
-                            "type": {"type": "string"},
-                            "description": {"type": "string"},
-                        },
-                        "required": ["name", "type", "description"],
-                    },
-                },
-                "relationships": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "source": {"type": "string"},
-                            "target": {"type": "string"},
-                            "type": {"type": "string"},
-                            "description": {"type": "string"},
-                        },
-                        "required": ["source", "target", "type"],
-                    },
-                },
-            },
-            "required": ["entities", "relationships"],
-        }
-
-        return await self._extract_structured(prompt, schema, self.capable_model)
+        prompt = (
+            _ENTITY_PROMPT_HEAD
+            + self._truncate_to_tokens(text, self.capable_model)
+            + _ENTITY_PROMPT_TAIL
+        )
+        return await self._extract_structured(prompt, _ENTITY_SCHEMA_JSON, self.capable_model)
+
+    async def extract_all(
+        self,
+        text: str,
+        doc_type: str,
+        schema: dict,
+        prompt_template: str = "",
+        schema_json: bytes | None = None,
+    ) -> tuple[dict, dict]:
+        """Extract metadata and entities in one capable-model request when EXTRACTOR_FUSED."""
+        if not EXTRACTOR_FUSED:
+            return await super().extract_all(text, doc_type, schema, prompt_template, schema_json)
+        head, placeholder, tail = self._metadata_skeleton(
+            doc_type, schema, schema_json or schema_cache_key(schema), prompt_template
+        )
+        prompt = (
+            head
+            + (self._truncate_to_tokens(text, self.capable_model) if placeholder else "")
+            + tail
+            + FUSED_ENTITY_INSTRUCTIONS
+        )
+        result = await self._extract_structured(
+            prompt,
+            schema_cache_key(fused_extraction_schema(schema, _ENTITY_SCHEMA)),
+            self.capable_model,
+        )
+        return split_fused_result(result)
 
     async def describe_image(self, image_base64: str, context: str = "") -> ImageDescription:
         """Describe an image using GPT Vision."""
@@ -129,6 +299,25 @@ For each relationship:
 
 Respond in JSON format."""
 
+        cache_key = make_cache_key(self.vision_model, prompt, image_base64)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            # Cached entries were validated when stored
+            return ImageDescription.model_construct(**cached)
+
+        return await self._singleflight(
+            cache_key, lambda: self._request_image_description(prompt, image_base64, cache_key)
+        )
+
+    async def _request_image_description(
+        self, prompt: str, image_base64: str, cache_key: str
+    ) -> ImageDescription:
+        """Call the vision model in JSON mode, falling back to a plain request."""
+        stored = await self._load_image_description(cache_key)
+        if stored is not None:
+            return stored
+
+        image_base64, media_type = await asyncio.to_thread(self._prepare_image, image_base64)
         messages = [
             {
                 "role": "user",
@@ -136,44 +325,52 @@ Respond in JSON format."""
                     {"type": "text", "text": prompt},
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
+                        "image_url": {"url": f"data:{media_type};base64,{image_base64}"},
                     },
                 ],
             }
         ]
-        _empty = ImageDescription(description="", detected_objects=[], ocr_text="", image_type="")
-
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                response_format={"type": "json_object"},
-            )
-            content = response.choices[0].message.content
-            result = self._parse_json_content(content)
-            if isinstance(result, dict):
-                return ImageDescription(**result)
-        except Exception as e:
-            logger.warning(
-                f"Image description with JSON mode failed ({e}); retrying without response_format"
-            )
-
-        # Fallback: retry without response_format
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-            )
-            content = response.choices[0].message.content
-            result = self._parse_json_content(content)
-            if isinstance(result, dict):
-                return ImageDescription(**result)
-        except Exception as e:
-            logger.error(f"Error in image description (fallback): {e}")
-
-        return _empty
+        async with self._semaphore:
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.vision_model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    response_format={"type": "json_object"},
+                )
+                content = response.choices[0].message.content
+                result = self._parse_json_content(content)
+                if isinstance(result, dict):
+                    description = ImageDescription.model_validate(result)
+                    await self._store_image_description(cache_key, description)
+                    return description
+            except Exception as e:
+                if _is_permanent_failure(e):
+                    logger.error("Error in image description: %s", e)
+                    return ImageDescription.empty()
+                logger.warning(
+                    "Image description with JSON mode failed (%s); "
+                    "retrying without response_format",
+                    e,
+                )
+
+            # Fallback: retry without response_format
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.vision_model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                )
+                content = response.choices[0].message.content
+                result = self._parse_json_content(content)
+                if isinstance(result, dict):
+                    description = ImageDescription.model_validate(result)
+                    await self._store_image_description(cache_key, description)
+                    return description
+            except Exception as e:
+                logger.error("Error in image description (fallback): %s", e)
+
+        return ImageDescription.empty()
 
     async def is_available(self) -> bool:
         """Check if OpenAI API is available."""
@@ -185,58 +382,69 @@ Respond in JSON format."""
             )
             return True
         except Exception as e:
-            logger.warning(f"OpenAI availability check failed: {e}")
+            logger.warning("OpenAI availability check failed: %s", e)
             return False
 
-    async def _extract_structured(self, prompt: str, schema: dict, model: str) -> dict:
-        """Extract structured data using OpenAI's JSON mode with fallback."""
-        try:
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a helpful assistant that extracts "
-                            "structured data. Always respond with valid JSON."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=self.max_tokens,
-                response_format={"type": "json_object"},
-            )
-            content = response.choices[0].message.content
-            result = self._parse_json_content(content)
-            if isinstance(result, dict):
-                return result
-        except Exception as e:
-            logger.warning(f"JSON mode extraction failed ({e}); retrying without response_format")
+    async def _extract_structured(self, prompt: str, schema_json: bytes, model: str) -> dict:
+        """Extract structured data using OpenAI structured outputs with fallback."""
+        cache_key = make_cache_key(model, prompt, schema_json)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-        # Fallback: retry without response_format
-        try:
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a helpful assistant that extracts "
-                            "structured data. Always respond with valid JSON."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=self.max_tokens,
-            )
-            content = response.choices[0].message.content
-            result = self._parse_json_content(content)
-            if isinstance(result, dict):
-                return result
-        except Exception as e:
-            logger.error(f"Error in structured extraction (fallback): {e}")
+        return await self._singleflight(
+            cache_key, lambda: self._request_structured(prompt, schema_json, model, cache_key)
+        )
 
-        return self._empty_response_for_schema(schema)
+    async def _request_structured(
+        self, prompt: str, schema_json: bytes, model: str, cache_key: str
+    ) -> dict:
+        """Call the provider with strict structured outputs, falling back to a plain request."""
+        async with self._semaphore:
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=self._structured_messages(prompt),
+                    max_tokens=self.max_tokens,
+                    response_format=_json_schema_response_format(schema_json),
+                )
+                content = response.choices[0].message.content
+                result = self._parse_json_content(content)
+                if isinstance(result, dict) and self._matches_schema(result, schema_json):
+                    self._cache.set(cache_key, result)
+                    return result
+            except Exception as e:
+                if _is_permanent_failure(e):
+                    logger.error("Error in structured extraction: %s", e)
+                    return self._empty_response_for_schema(schema_json)
+                logger.warning(
+                    "Structured output extraction failed (%s); retrying without response_format",
+                    e,
+                )
+
+            # Fallback: retry without response_format
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=self._structured_messages(prompt),
+                    max_tokens=self.max_tokens,
+                )
+                content = response.choices[0].message.content
+                result = self._parse_json_content(content)
+                if isinstance(result, dict) and self._matches_schema(result, schema_json):
+                    self._cache.set(cache_key, result)
+                    return result
+            except Exception as e:
+                logger.error("Error in structured extraction (fallback): %s", e)
+
+        return self._empty_response_for_schema(schema_json)
+
+    def _structured_messages(self, prompt: str) -> list[dict]:
+        """Build the chat messages for a structured extraction request."""
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
 
     def _parse_json_content(self, content: str | None) -> dict | None:
         """Parse JSON from LLM response content using three-stage extraction.
@@ -244,7 +452,7 @@ Respond in JSON format."""
         Stages:
         1. Direct parse of stripped content
         2. Extract from fenced markdown blocks (```json {...}```)
-        3. Substring between first { and last }
+        3. First well-formed {...} object embedded in surrounding text
 
         Returns:
             Parsed dict or None on all failures
@@ -256,8 +464,8 @@ Respond in JSON format."""
 
         # Stage 1: direct parse
         try:
-            return json.loads(stripped)
-        except json.JSONDecodeError:
+            return orjson.loads(stripped)
+        except orjson.JSONDecodeError:
             pass
 
         # Stage 2: fenced markdown block
@@ -268,30 +476,9 @@ Respond in JSON format."""
             end = fenced_content.rfind("}")
             if start >= 0 and end > start:
                 try:
-                    return json.loads(fenced_content[start : end + 1])
-                except json.JSONDecodeError:
+                    return orjson.loads(fenced_content[start : end + 1])
+                except orjson.JSONDecodeError:
                     pass
 
-        # Stage 3: first { to last }
-        start = stripped.find("{")
-        end = stripped.rfind("}")
-        if start >= 0 and end > start:
-            try:
-                return json.loads(stripped[start : end + 1])
-            except json.JSONDecodeError:
-                pass
-
-        return None
-
-    def _empty_response_for_schema(self, schema: dict) -> dict:
-        """Generate an empty response matching the schema structure."""
-        result = {}
-        if "properties" in schema:
-            for key, prop in schema["properties"].items():
-                if prop.get("type") == "array":
-                    result[key] = []
-                elif prop.get("type") == "string":
-                    result[key] = ""
-                elif prop.get("type") == "object":
-                    result[key] = {}
-        return result
+        # Stage 3: first well-formed object embedded in prose
+        return first_json_object(stripped)
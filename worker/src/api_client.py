@@ -4,34 +4,54 @@ import logging
 from typing import Any
 
 import httpx
+import orjson
 
-from src.config import API_TOKEN, API_URL
+from src.config import API_TOKEN, API_URL, HTTPX_LIMITS, HTTPX_TIMEOUT, WORKER_ID
 
 logger = logging.getLogger(__name__)
 
+# Request bodies are serialized with orjson and sent as raw content
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 # Global HTTP client
 _client: httpx.AsyncClient | None = None
 
 
-def get_client() -> httpx.AsyncClient:
-    """Get or create the httpx async client.
+def init_client() -> httpx.AsyncClient:
+    """Create the shared httpx async client.
+
+    Called once at worker startup so every request reuses the same pool.
 
     Returns:
         httpx async client with configured base URL and auth
     """
     global _client
+    headers = {}
+    if API_TOKEN:
+        headers["Authorization"] = f"Bearer {API_TOKEN}"
+
+    _client = httpx.AsyncClient(
+        base_url=API_URL,
+        headers=headers,
+        timeout=HTTPX_TIMEOUT,
+        limits=HTTPX_LIMITS,
+        http2=True,
+    )
+    logger.info("HTTP client created for API: %s", API_URL)
+    return _client
+
+
+def get_client() -> httpx.AsyncClient:
+    """Get the shared httpx async client.
+
+    Returns:
+        The client created by init_client
+
+    Raises:
+        RuntimeError: If init_client has not been called
+    """
     if _client is None:
-        headers = {}
-        if API_TOKEN:
-            headers["Authorization"] = f"Bearer {API_TOKEN}"
-
-        _client = httpx.AsyncClient(
-            base_url=API_URL,
-            headers=headers,
-            timeout=httpx.Timeout(60.0),
-            http2=True,
-        )
-        logger.info(f"HTTP client created for API: {API_URL}")
+        raise RuntimeError("API client not initialized; call init_client() at startup")
     return _client
 
 
@@ -44,65 +64,74 @@ async def close_client() -> None:
         logger.info("HTTP client closed")
 
 
-async def claim_task(worker_id: str) -> dict[str, Any] | None:
-    """Claim next available task from the enrichment queue.
+def _chunk_texts_by_index(chunks: list[dict[str, Any]]) -> dict[int, str]:
+    """Map chunkIndex to chunk text, in chunkIndex order.
+
+    The claim endpoint sorts chunks by chunk_index, which is unique per document,
+    so a list spanning 0..n-1 is already dense and in order and needs no re-sort.
+    """
+    texts = {chunk.get("chunkIndex", 0): chunk.get("text", "") for chunk in chunks}
+    if texts and next(iter(texts)) == 0 and next(reversed(texts)) == len(texts) - 1:
+        return texts
+    return dict(sorted(texts.items()))
+
+
+def _build_task(task_data: dict[str, Any], chunks: list[dict[str, Any]]) -> dict[str, Any]:
+    """Combine a claimed task's metadata and its document's chunks into a task dict."""
+    # Build task payload combining task metadata and chunks
+    payload = task_data.get("payload") or {}
+
+    # Find the chunk text for this specific chunk
+    texts = _chunk_texts_by_index(chunks)
+    chunk_text = texts.get(payload.get("chunkIndex", 0), "")
+    all_chunks = list(texts.values())
+
+    # Build task object matching the legacy format. The payload was freshly
+    # decoded from the response, so it is extended in place rather than copied.
+    payload["taskId"] = task_data["id"]
+    payload["attempt"] = task_data["attempt"]
+    payload["text"] = chunk_text
+    payload["allChunks"] = all_chunks
+
+    return payload
+
+
+async def claim_tasks(worker_id: str, max_tasks: int, wait_ms: int = 0) -> list[dict[str, Any]]:
+    """Claim up to max_tasks available tasks in a single request.
 
     Args:
         worker_id: Unique identifier for this worker instance
+        max_tasks: Maximum number of tasks to claim
+        wait_ms: How long the API may hold the request open waiting for a task
 
     Returns:
-        Task dictionary with chunk texts if a task was claimed, None if no tasks available
+        Task dictionaries with chunk texts; empty if no tasks are available
     """
     client = get_client()
 
     try:
         response = await client.post(
-            "/internal/tasks/claim",
-            json={"workerId": worker_id, "leaseDuration": 300},
+            "/internal/tasks/claim-batch",
+            content=orjson.dumps(
+                {
+                    "workerId": worker_id,
+                    "leaseDuration": 300,
+                    "maxTasks": max_tasks,
+                    "waitMs": wait_ms,
+                }
+            ),
+            headers=_JSON_HEADERS,
         )
         response.raise_for_status()
 
-        data = response.json()
-
-        # No task available
-        if not data.get("task"):
-            return None
-
-        task_data = data["task"]
-        chunks = data.get("chunks", [])
-
-        # Build task payload combining task metadata and chunks
-        payload = task_data.get("payload", {})
-
-        # Find the chunk text for this specific chunk
-        chunk_index = payload.get("chunkIndex", 0)
-        chunk_text = ""
-        for chunk in chunks:
-            if chunk.get("chunkIndex") == chunk_index:
-                chunk_text = chunk.get("text", "")
-                break
-
-        all_chunks = [
-            chunk.get("text", "")
-            for chunk in sorted(chunks, key=lambda item: item.get("chunkIndex", 0))
-        ]
-
-        # Build task object matching the legacy format
-        task = {
-            **payload,
-            "taskId": task_data["id"],
-            "attempt": task_data["attempt"],
-            "text": chunk_text,
-            "allChunks": all_chunks,
-        }
-
-        return task
+        data = orjson.loads(response.content)
+        return [_build_task(item["task"], item.get("chunks", [])) for item in data["tasks"]]
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error claiming task: {e.response.status_code} {e.response.text}")
+        logger.error("HTTP error claiming tasks: %s %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Error claiming task: {e}")
+        logger.error("Error claiming tasks: %s", e)
         raise
 
 
@@ -115,7 +144,8 @@ async def submit_result(
     entities: list[dict] | None = None,
     relationships: list[dict] | None = None,
     summary: str | None = None,
-) -> None:
+    claim_next: int = 0,
+) -> list[dict[str, Any]]:
     """Submit enrichment results for a task.
 
     Args:
@@ -127,6 +157,10 @@ async def submit_result(
         entities: List of extracted entities
         relationships: List of entity relationships
         summary: Document summary
+        claim_next: Claim up to this many further tasks in the same request
+
+    Returns:
+        Tasks claimed along with the result; empty when claim_next is 0
     """
     client = get_client()
 
@@ -145,21 +179,31 @@ async def submit_result(
         payload["relationships"] = relationships
     if summary is not None:
         payload["summary"] = summary
+    if claim_next:
+        payload["claimNext"] = claim_next
+        payload["workerId"] = WORKER_ID
+        payload["leaseDuration"] = 300
 
     try:
         response = await client.post(
             f"/internal/tasks/{task_id}/result",
-            json=payload,
+            content=orjson.dumps(payload),
+            headers=_JSON_HEADERS,
         )
         response.raise_for_status()
 
-        logger.debug(f"Successfully submitted result for task {task_id}")
+        logger.debug("Successfully submitted result for task %s", task_id)
+
+        if not claim_next:
+            return []
+        data = orjson.loads(response.content)
+        return [_build_task(item["task"], item.get("chunks", [])) for item in data.get("tasks", [])]
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error submitting result: {e.response.status_code} {e.response.text}")
+        logger.error("HTTP error submitting result: %s %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Error submitting result: {e}")
+        logger.error("Error submitting result: %s", e)
         raise
 
 
@@ -177,17 +221,22 @@ async def fail_task(task_id: str, error_msg: str) -> None:
     try:
         response = await client.post(
             f"/internal/tasks/{task_id}/fail",
-            json={"error": error_msg},
+            content=orjson.dumps({"error": error_msg}),
+            headers=_JSON_HEADERS,
         )
+        if response.status_code == 409:
+            # The task left processing first (usually its lease expired and it was re-queued)
+            logger.warning("Failure for task %s was not recorded: %s", task_id, response.text)
+            return
         response.raise_for_status()
 
-        logger.debug(f"Successfully reported failure for task {task_id}")
+        logger.debug("Successfully reported failure for task %s", task_id)
 
     except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error reporting failure: {e.response.status_code} {e.response.text}")
+        logger.error("HTTP error reporting failure: %s %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logger.error(f"Error reporting failure: {e}")
+        logger.error("Error reporting failure: %s", e)
         raise
 
 
@@ -203,19 +252,19 @@ async def recover_stale() -> int:
         response = await client.post("/internal/tasks/recover-stale")
         response.raise_for_status()
 
-        data = response.json()
+        data = orjson.loads(response.content)
         count = data.get("recovered", 0)
 
         if count > 0:
-            logger.warning(f"Recovered {count} stale task(s) with expired leases")
+            logger.warning("Recovered %s stale task(s) with expired leases", count)
 
         return count
 
     except httpx.HTTPStatusError as e:
         logger.error(
-            f"HTTP error recovering stale tasks: {e.response.status_code} {e.response.text}"
+            "HTTP error recovering stale tasks: %s %s", e.response.status_code, e.response.text
         )
         raise
     except Exception as e:
-        logger.error(f"Error recovering stale tasks: {e}")
+        logger.error("Error recovering stale tasks: %s", e)
         raise
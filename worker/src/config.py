@@ -1,5 +1,18 @@
 import os
 
+import httpx
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    return float(os.environ.get(name, default))
+
+
 # API communication settings
 API_URL = os.environ.get("API_URL", "http://localhost:3000")
 API_TOKEN = os.environ.get("API_TOKEN", "")
@@ -9,7 +22,28 @@ OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 OLLAMA_API_KEY = os.environ.get("OLLAMA_API_KEY", "")
 
 OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
-EXTRACTOR_MAX_OUTPUT_TOKENS = int(os.environ.get("EXTRACTOR_MAX_OUTPUT_TOKENS", "16384"))
+EXTRACTOR_MAX_OUTPUT_TOKENS = _env_int("EXTRACTOR_MAX_OUTPUT_TOKENS", 16384)
+# Document text sent to the LLM is truncated to this many tokens
+EXTRACTOR_MAX_INPUT_TOKENS = _env_int("EXTRACTOR_MAX_INPUT_TOKENS", 2000)
+# Upper bound on in-flight LLM requests per adapter instance
+LLM_CONCURRENCY = _env_int("LLM_CONCURRENCY", 50)
+# SDK-level retries for transient LLM errors (connection, 429, 5xx) with backoff + jitter
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 3)
+# Ask for metadata and entities/relationships in one LLM request per document
+EXTRACTOR_FUSED = os.environ.get("EXTRACTOR_FUSED", "false").strip().lower() == "true"
+# Allow parallel tool calls in tool-use extraction; unset keeps the provider default.
+# Anthropic only: the OpenAI and Ollama adapters use response_format, not tools
+PARALLEL_TOOL_CALLS = {"true": True, "false": False}.get(
+    os.environ.get("PARALLEL_TOOL_CALLS", "").strip().lower()
+)
+# Embed schemas in prompts as indented JSON with titles/descriptions (debugging aid)
+PRETTY_SCHEMA = os.environ.get("PRETTY_SCHEMA", "false").strip().lower() == "true"
+# In-process cache of LLM responses keyed by (model, prompt); size 0 disables it
+LLM_CACHE_SIZE = _env_int("LLM_CACHE_SIZE", 1024)
+LLM_CACHE_TTL_SECONDS = _env_float("LLM_CACHE_TTL_SECONDS", 3600)
+# Persistent image-description cache directory; empty disables it
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "")
+IMAGE_CACHE_MAX_ENTRIES = _env_int("IMAGE_CACHE_MAX_ENTRIES", 100000)
 
 EXTRACTOR_MODEL_FAST = os.environ.get("EXTRACTOR_MODEL_FAST", "gpt-4.1-mini")
 EXTRACTOR_MODEL_CAPABLE = os.environ.get("EXTRACTOR_MODEL_CAPABLE", "gpt-4.1-mini")
@@ -47,6 +81,31 @@ def resolve_extractor_provider() -> str:
 EXTRACTOR_PROVIDER = resolve_extractor_provider()
 
 # Worker settings
-WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "4"))
+WORKER_ID = os.environ.get("HOSTNAME", f"worker-{os.getpid()}")
+WORKER_CONCURRENCY = _env_int("WORKER_CONCURRENCY", 4)
 MAX_RETRIES = 3
 QUEUE_NAME = "enrichment"
+# Long-poll: how long an empty claim waits server-side for a task; 0 polls once per second
+CLAIM_WAIT_MS = _env_int("CLAIM_WAIT_MS", 20000)
+# Run tier-2 spaCy NLP in this many subprocesses to sidestep the GIL; 0 uses threads
+NLP_PROCESSES = _env_int("NLP_PROCESSES", 0)
+# Most chunks coalesced into one spaCy nlp.pipe call when tier-2 requests queue up
+NLP_BATCH_SIZE = _env_int("NLP_BATCH_SIZE", 32)
+# Run spaCy on a GPU when CUDA is available (falls back to CPU); pair with a larger
+# NLP_BATCH_SIZE and keep NLP_PROCESSES=0 and nlp.pipe n_process=1
+NLP_GPU = os.environ.get("NLP_GPU", "false").strip().lower() == "true"
+# Documents whose detected language is remembered for their later chunks; 0 disables
+LANGUAGE_CACHE_SIZE = _env_int("LANGUAGE_CACHE_SIZE", 4096)
+
+# Connection pool for the internal API client, sized to the worker's fan-out
+HTTPX_MAX_CONNECTIONS = _env_int("HTTPX_MAX_CONNECTIONS", max(100, WORKER_CONCURRENCY * 4))
+HTTPX_MAX_KEEPALIVE_CONNECTIONS = _env_int(
+    "HTTPX_MAX_KEEPALIVE_CONNECTIONS", max(40, WORKER_CONCURRENCY * 2)
+)
+HTTPX_KEEPALIVE_EXPIRY = _env_float("HTTPX_KEEPALIVE_EXPIRY", 30)
+HTTPX_LIMITS = httpx.Limits(
+    max_connections=HTTPX_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTPX_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=HTTPX_KEEPALIVE_EXPIRY,
+)
+HTTPX_TIMEOUT = httpx.Timeout(60.0)
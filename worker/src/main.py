@@ -1,31 +1,45 @@
 import asyncio
 import logging
-import os
 import time
 
 from src import api_client
+from src.adapters import get_adapter, reset_adapter
 from src.config import (
+    CLAIM_WAIT_MS,
     EXTRACTOR_PROVIDER,
     MAX_RETRIES,
     OPENAI_API_KEY,
     OPENAI_BASE_URL,
     QUEUE_NAME,
     WORKER_CONCURRENCY,
+    WORKER_ID,
 )
-from src.pipeline import process_task
+from src.pipeline import (
+    close_tier2_batcher,
+    init_tier2_batcher,
+    process_task,
+    shutdown_nlp_pool,
+    warm_up_nlp,
+)
+
+try:
+    import uvloop
+except ImportError:  # uvloop does not support Windows
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger(__name__)
 
-# Generate unique worker ID
-WORKER_ID = os.environ.get("HOSTNAME", f"worker-{os.getpid()}")
 
-
-async def process_task_with_retry(task: dict) -> None:
+async def process_task_with_retry(task: dict) -> list[dict]:
     """Process a task with retry logic and dead-letter handling.
 
     Args:
         task: Task dictionary from API
+
+    Returns:
+        The next task, claimed together with this task's result; empty if the
+        queue had none or this task failed
     """
     task_id = task.get("taskId", "unknown")
     attempt = task.get("attempt", 1)
@@ -33,45 +47,91 @@ async def process_task_with_retry(task: dict) -> None:
     try:
         start_time = time.time()
 
-        # Process the task
-        await process_task(task)
+        # Process the task, claiming its successor in the same request
+        next_tasks = await process_task(task, claim_next=1)
 
         elapsed_ms = int((time.time() - start_time) * 1000)
 
         # Log structured completion event
         logger.info(
-            f"enrichment_complete taskId={task_id} baseId={task.get('baseId')} "
-            f"docType={task.get('docType')} chunkIndex={task.get('chunkIndex')} "
-            f"attempt={attempt} elapsed_ms={elapsed_ms}"
+            "enrichment_complete taskId=%s baseId=%s docType=%s chunkIndex=%s "
+            "attempt=%s elapsed_ms=%s",
+            task_id,
+            task.get("baseId"),
+            task.get("docType"),
+            task.get("chunkIndex"),
+            attempt,
+            elapsed_ms,
         )
+        return next_tasks
 
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"Task {task_id} failed (attempt {attempt}/{MAX_RETRIES}): {error_msg}")
+        logger.error("Task %s failed (attempt %s/%s): %s", task_id, attempt, MAX_RETRIES, error_msg)
 
         # Report failure to API - API handles retry/dead-letter logic
         await api_client.fail_task(task_id, error_msg)
+        return []
+
+
+async def run_slot(task: dict) -> None:
+    """Process tasks in one concurrency slot for as long as results bring new ones."""
+    while task:
+        next_tasks = await process_task_with_retry(task)
+        task = next_tasks[0] if next_tasks else None
 
 
 async def worker_task() -> None:
-    """Worker task that processes items from the queue using HTTP polling."""
-    while True:
-        try:
-            # Try to claim a task via HTTP
-            task = await api_client.claim_task(WORKER_ID)
+    """Claim tasks via HTTP polling and process up to WORKER_CONCURRENCY at once.
 
-            if task is None:
-                # No tasks available - sleep to avoid busy-looping
-                await asyncio.sleep(1)
-                continue
+    A single loop claims as many tasks as there are free concurrency slots in
+    one request and hands each task to its own coroutine. A busy slot picks up
+    its next task from the result submission instead of a separate claim. An
+    idle queue is long-polled, so new tasks start without waiting out a sleep.
+    """
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    running: set[asyncio.Task] = set()
 
-            # Process the task
-            await process_task_with_retry(task)
+    def on_done(job: asyncio.Task) -> None:
+        running.discard(job)
+        slots.release()
+        if not job.cancelled() and job.exception() is not None:
+            logger.error("Error in worker task: %s", job.exception(), exc_info=job.exception())
 
-        except Exception as e:
-            logger.error(f"Error in worker task: {e}", exc_info=True)
-            # Brief pause before retrying to avoid tight error loop
-            await asyncio.sleep(1)
+    try:
+        while True:
+            # Wait for one free slot, then take every other slot that is free
+            await slots.acquire()
+            free = 1
+            while not slots.locked():
+                await slots.acquire()
+                free += 1
+
+            try:
+                # Try to claim tasks via HTTP; the API holds an empty claim open
+                # until a task is enqueued or CLAIM_WAIT_MS elapses
+                tasks = await api_client.claim_tasks(WORKER_ID, free, CLAIM_WAIT_MS)
+            except Exception as e:
+                tasks = None
+                logger.error("Error in worker task: %s", e, exc_info=True)
+
+            for _ in range(free - len(tasks or ())):
+                slots.release()
+
+            if not tasks:
+                if tasks is None or not CLAIM_WAIT_MS:
+                    # Claim failed or long-polling is off - sleep to avoid busy-looping
+                    await asyncio.sleep(1)
+                continue
+
+            for task in tasks:
+                job = asyncio.create_task(run_slot(task))
+                running.add(job)
+                job.add_done_callback(on_done)
+    finally:
+        for job in running:
+            job.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
 
 
 async def watchdog_task() -> None:
@@ -81,13 +141,13 @@ async def watchdog_task() -> None:
             await asyncio.sleep(60)
             await api_client.recover_stale()
         except Exception as e:
-            logger.error(f"Error in watchdog task: {e}", exc_info=True)
+            logger.error("Error in watchdog task: %s", e, exc_info=True)
 
 
 async def worker_loop() -> None:
     """Main worker loop with multiple concurrent tasks and watchdog."""
-    logger.info(f"Worker started with concurrency={WORKER_CONCURRENCY}, id={WORKER_ID}")
-    logger.info(f"Listening on queue: {QUEUE_NAME}")
+    logger.info("Worker started with concurrency=%s, id=%s", WORKER_CONCURRENCY, WORKER_ID)
+    logger.info("Listening on queue: %s", QUEUE_NAME)
     logger.info(
         "Extractor provider resolved to %s (OPENAI_API_KEY_present=%s, OPENAI_BASE_URL=%s)",
         EXTRACTOR_PROVIDER,
@@ -95,32 +155,41 @@ async def worker_loop() -> None:
         OPENAI_BASE_URL,
     )
 
-    # Create fixed number of worker tasks for concurrency control
-    # Each worker processes one task at a time from the queue
-    workers = [asyncio.create_task(worker_task()) for _ in range(WORKER_CONCURRENCY)]
+    # One shared HTTP client for the process lifetime
+    api_client.init_client()
+    adapter = get_adapter()
+    init_tier2_batcher()
+    await warm_up_nlp()
+
+    worker = asyncio.create_task(worker_task())
 
     # Add watchdog task for stale lease recovery
     watchdog = asyncio.create_task(watchdog_task())
 
     try:
-        # Wait for all workers (they run forever)
-        await asyncio.gather(*workers, watchdog)
+        # Wait for the worker and watchdog (they run forever)
+        await asyncio.gather(worker, watchdog)
     except KeyboardInterrupt:
         logger.info("Shutting down worker...")
-        # Cancel all tasks
-        for worker in workers:
-            worker.cancel()
+        worker.cancel()
         watchdog.cancel()
         # Wait for cancellation to complete
-        await asyncio.gather(*workers, watchdog, return_exceptions=True)
+        await asyncio.gather(worker, watchdog, return_exceptions=True)
     finally:
         await api_client.close_client()
+        await adapter.aclose()
+        # The adapter's clients are bound to this loop; a later loop gets a fresh one
+        reset_adapter()
+        await close_tier2_batcher()
+        shutdown_nlp_pool()
 
 
 def main():
     """Entry point for the enrichment worker."""
+    # libuv-based event loop: cheaper task scheduling and socket dispatch
+    run = uvloop.run if uvloop is not None else asyncio.run
     try:
-        asyncio.run(worker_loop())
+        run(worker_loop())
     except KeyboardInterrupt:
         logger.info("Worker stopped by user")
 
@@ -2,16 +2,68 @@
 
 import asyncio
 import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-from src import api_client
+from src import api_client, tier2
 from src.adapters import get_adapter
-from src.schemas import get_schema_for_doctype
-from src.tier2 import detect_language, process_text_nlp
+from src.config import LANGUAGE_CACHE_SIZE, NLP_BATCH_SIZE, NLP_PROCESSES
+from src.schemas import get_json_schema_for_doctype
+from src.tier2 import detect_language, process_texts_nlp_batch
 
 logger = logging.getLogger(__name__)
 
-# Initialize adapter
-adapter = get_adapter()
+# Created on first use when NLP_PROCESSES > 0
+_nlp_pool: ProcessPoolExecutor | None = None
+
+# Language is a document-level property: the first chunk detected for a
+# (collection, base_id) answers for the rest of that document's chunks
+_document_languages: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+
+def _init_nlp_process() -> None:
+    """Load and warm the spaCy pipeline once per NLP subprocess."""
+    try:
+        tier2.warmup()
+    except RuntimeError as e:
+        logger.warning("NLP subprocess could not preload spaCy: %s", e)
+
+
+def _get_nlp_pool() -> ProcessPoolExecutor | None:
+    """Return the tier-2 subprocess pool, or None when NLP runs in threads."""
+    global _nlp_pool
+    if _nlp_pool is None and NLP_PROCESSES > 0:
+        _nlp_pool = ProcessPoolExecutor(
+            max_workers=NLP_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_nlp_process,
+        )
+    return _nlp_pool
+
+
+async def warm_up_nlp() -> None:
+    """Load spaCy before the first task arrives instead of on its request path."""
+    pool = _get_nlp_pool()
+    if pool is None:
+        try:
+            await asyncio.to_thread(tier2.warmup)
+        except RuntimeError as e:
+            logger.warning("Could not preload spaCy: %s", e)
+        return
+    # One call per slot starts every subprocess, each loading spaCy in its initializer
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(loop.run_in_executor(pool, _init_nlp_process) for _ in range(NLP_PROCESSES))
+    )
+
+
+def shutdown_nlp_pool() -> None:
+    """Stop the tier-2 subprocesses, if any were started."""
+    global _nlp_pool
+    if _nlp_pool is not None:
+        _nlp_pool.shutdown(cancel_futures=True)
+        _nlp_pool = None
 
 
 def _normalize_tier3_metadata(tier3_meta: dict) -> dict:
@@ -80,11 +132,15 @@ def _normalize_tier3_metadata(tier3_meta: dict) -> dict:
     return tier3_meta
 
 
-async def process_task(task: dict) -> None:
+async def process_task(task: dict, claim_next: int = 0) -> list[dict]:
     """Process a single enrichment task through the full pipeline.
 
     Args:
         task: Task dictionary from API
+        claim_next: Claim up to this many further tasks along with the result
+
+    Returns:
+        Tasks claimed along with the result
     """
     base_id = task["baseId"]
     doc_type = task["docType"]
@@ -96,12 +152,9 @@ async def process_task(task: dict) -> None:
     task_id = task["taskId"]
     all_chunks = task.get("allChunks")
 
-    logger.info(f"Processing task for {base_id}:{chunk_index}/{total_chunks}")
+    logger.info("Processing task for %s:%s/%s", base_id, chunk_index, total_chunks)
 
     try:
-        # Tier 2: NLP extraction (per-chunk)
-        tier2_data = await run_tier2_extraction(text)
-
         # Tier 3: LLM extraction (document-level - only on last chunk)
         tier3_data = None
         entities = None
@@ -109,17 +162,24 @@ async def process_task(task: dict) -> None:
         summary = None
 
         if chunk_index == total_chunks - 1:
-            tier3_result = await run_document_level_extraction(
-                base_id, doc_type, text, total_chunks, source, all_chunks
+            # Tier-2 NLP runs in worker threads while the LLM calls are in flight
+            tier2_data, tier3_result = await asyncio.gather(
+                run_tier2_extraction(text, (collection, base_id)),
+                run_document_level_extraction(
+                    base_id, doc_type, text, total_chunks, source, all_chunks
+                ),
             )
             tier3_data = tier3_result.get("tier3")
             entities = tier3_result.get("entities")
             relationships = tier3_result.get("relationships")
             summary = tier3_result.get("summary")
+        else:
+            # Tier 2: NLP extraction (per-chunk)
+            tier2_data = await run_tier2_extraction(text, (collection, base_id))
 
         # Submit all results in a single HTTP call
         chunk_id = f"{base_id}:{chunk_index}"
-        await api_client.submit_result(
+        next_tasks = await api_client.submit_result(
             task_id=task_id,
             chunk_id=chunk_id,
             collection=collection,
@@ -128,65 +188,214 @@ async def process_task(task: dict) -> None:
             entities=entities,
             relationships=relationships,
             summary=summary,
+            claim_next=claim_next,
         )
 
-        logger.info(f"Successfully processed {base_id}:{chunk_index}")
+        logger.info("Successfully processed %s:%s", base_id, chunk_index)
+        return next_tasks
 
     except Exception as e:
-        logger.error(f"Error processing task {base_id}:{chunk_index}: {e}", exc_info=True)
+        logger.error("Error processing task %s:%s: %s", base_id, chunk_index, e, exc_info=True)
         raise
 
 
-async def run_tier2_extraction(text: str) -> dict:
+def _tier2_batch_sync(
+    texts: list[str], detect: list[bool]
+) -> list[tuple[dict | Exception, str | Exception | None]]:
+    """Run the blocking tier-2 steps for a batch of texts.
+
+    Entities and keywords come from one nlp.pipe pass; language is detected per
+    text where detect is set, and is None otherwise. A failed step is returned
+    as its exception.
+    """
+    try:
+        nlp_results = process_texts_nlp_batch(texts, NLP_BATCH_SIZE)
+    except Exception as e:
+        nlp_results = [e] * len(texts)
+    results = []
+    for text, nlp_result, detect_text in zip(texts, nlp_results, detect, strict=True):
+        if not detect_text:
+            results.append((nlp_result, None))
+            continue
+        try:
+            language_result = detect_language(text)
+        except Exception as e:
+            language_result = e
+        results.append((nlp_result, language_result))
+    return results
+
+
+async def _run_tier2_batch(
+    texts: list[str], detect: list[bool]
+) -> list[tuple[dict | Exception, str | Exception | None]]:
+    """Run _tier2_batch_sync off the event loop, in the NLP subprocesses if configured."""
+    try:
+        pool = _get_nlp_pool()
+        if pool is None:
+            return await asyncio.to_thread(_tier2_batch_sync, texts, detect)
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, _tier2_batch_sync, texts, detect
+        )
+    except Exception as e:
+        # The executor itself failed (e.g. a broken process pool)
+        return [(e, e)] * len(texts)
+
+
+class _Tier2Batcher:
+    """Coalesce concurrent tier-2 requests into shared nlp.pipe batches.
+
+    A request starts a batch at once when an executor slot is free; requests
+    arriving while every slot is busy queue up and go out together when one
+    frees. Batching therefore adds no latency at low load.
+    """
+
+    def __init__(self) -> None:
+        self._queue: list[tuple[str, bool, asyncio.Future]] = []
+        self._in_flight = 0
+        self._batches: set[asyncio.Task] = set()
+
+    async def run(
+        self, text: str, detect: bool = True
+    ) -> tuple[dict | Exception, str | Exception | None]:
+        """Queue text for tier-2 processing and wait for its (nlp, language) result."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((text, detect, future))
+        self._dispatch()
+        return await future
+
+    async def aclose(self) -> None:
+        """Cancel queued requests and in-flight batches."""
+        queued, self._queue = self._queue, []
+        for _, _, future in queued:
+            future.cancel()
+        for task in self._batches:
+            task.cancel()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+
+    def _dispatch(self) -> None:
+        """Start batches from the queue while executor slots are free."""
+        while self._queue and self._in_flight < max(1, NLP_PROCESSES):
+            batch = self._queue[:NLP_BATCH_SIZE]
+            del self._queue[:NLP_BATCH_SIZE]
+            self._in_flight += 1
+            task = asyncio.create_task(self._process(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _process(self, batch: list[tuple[str, bool, asyncio.Future]]) -> None:
+        texts = [text for text, _, _ in batch]
+        detect = [detect_text for _, detect_text, _ in batch]
+        futures = [future for _, _, future in batch]
+        try:
+            results = await _run_tier2_batch(texts, detect)
+            for future, result in zip(futures, results, strict=True):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # A cancelled batch must not leave its callers waiting forever
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+            self._in_flight -= 1
+            self._dispatch()
+
+
+# Created by init_tier2_batcher at worker startup, on the worker's event loop;
+# without it each tier-2 request runs as its own batch
+_tier2_batcher: _Tier2Batcher | None = None
+
+
+def init_tier2_batcher() -> None:
+    """Start coalescing concurrent tier-2 requests on the running event loop."""
+    global _tier2_batcher
+    _tier2_batcher = _Tier2Batcher()
+
+
+async def close_tier2_batcher() -> None:
+    """Cancel pending tier-2 batches and stop batching."""
+    global _tier2_batcher
+    if _tier2_batcher is not None:
+        await _tier2_batcher.aclose()
+        _tier2_batcher = None
+
+
+def _cached_language(document: tuple[str, str] | None) -> str | None:
+    """Return the language already detected for a document, if cached."""
+    if document is None or document not in _document_languages:
+        return None
+    _document_languages.move_to_end(document)
+    return _document_languages[document]
+
+
+def _cache_language(document: tuple[str, str] | None, language: str) -> None:
+    """Remember a document's detected language, evicting the oldest entries."""
+    if document is None or LANGUAGE_CACHE_SIZE <= 0 or language == "unknown":
+        return
+    _document_languages[document] = language
+    _document_languages.move_to_end(document)
+    while len(_document_languages) > LANGUAGE_CACHE_SIZE:
+        _document_languages.popitem(last=False)
+
+
+def _empty_tier2() -> dict:
+    """Tier-2 result for a chunk with nothing extracted."""
+    return {"entities": [], "keywords": [], "language": "unknown"}
+
+
+async def run_tier2_extraction(text: str, document: tuple[str, str] | None = None) -> dict:
     """Run tier-2 NLP extraction on text.
 
     Args:
         text: Text to analyze
+        document: (collection, base_id) of the chunk; reuses the language
+            detected for an earlier chunk of the same document
 
     Returns:
         Dictionary with tier-2 extracted data
     """
-    tier2 = {}
+    # Nothing to analyze: skip the executor hop and the spaCy/langdetect work
+    if not text or text.isspace():
+        return _empty_tier2()
 
     try:
-        # Run CPU-bound NLP extractions in thread pool to avoid blocking event loop
-        # Use optimized single-pass NLP for entities + keywords
-        nlp_task = asyncio.to_thread(process_text_nlp, text)
-        language_task = asyncio.to_thread(detect_language, text)
-
-        nlp_result, language_result = await asyncio.gather(
-            nlp_task,
-            language_task,
-            return_exceptions=True,
-        )
+        cached_language = _cached_language(document)
+        detect = cached_language is None
+        if _tier2_batcher is not None:
+            # Chunks processed concurrently share one spaCy pass
+            nlp_result, language_result = await _tier2_batcher.run(text, detect)
+        else:
+            ((nlp_result, language_result),) = await _run_tier2_batch([text], [detect])
 
         # Handle NLP result (entities + keywords)
         if isinstance(nlp_result, Exception):
-            logger.warning(f"Tier-2 NLP extraction failed: {nlp_result}")
-            tier2["entities"] = []
-            tier2["keywords"] = []
+            logger.warning("Tier-2 NLP extraction failed: %s", nlp_result)
+            entities, keywords = [], []
         else:
-            tier2["entities"] = nlp_result.get("entities", [])
-            tier2["keywords"] = nlp_result.get("keywords", [])
+            entities = nlp_result.get("entities", [])
+            keywords = nlp_result.get("keywords", [])
 
         # Handle language detection result
-        if isinstance(language_result, Exception):
-            logger.warning(f"Tier-2 language detection failed: {language_result}")
-            tier2["language"] = "unknown"
+        if cached_language is not None:
+            language = cached_language
+        elif isinstance(language_result, Exception):
+            logger.warning("Tier-2 language detection failed: %s", language_result)
+            language = "unknown"
         else:
-            tier2["language"] = language_result
+            language = language_result
+            _cache_language(document, language)
 
         logger.debug(
-            f"Tier-2 extraction: {len(tier2['entities'])} entities, "
-            f"{len(tier2['keywords'])} keywords, lang={tier2['language']}"
+            "Tier-2 extraction: %d entities, %d keywords, lang=%s",
+            len(entities),
+            len(keywords),
+            language,
         )
+        return {"entities": entities, "keywords": keywords, "language": language}
 
     except Exception as e:
         # Fallback in case of unexpected errors outside individual tasks
-        logger.warning(f"Tier-2 extraction failed: {e}")
-        tier2 = {"entities": [], "keywords": [], "language": "unknown"}
-
-    return tier2
+        logger.warning("Tier-2 extraction failed: %s", e)
+        return _empty_tier2()
 
 
 async def run_document_level_extraction(
@@ -210,30 +419,30 @@ async def run_document_level_extraction(
     Returns:
         Dictionary with tier3, entities, relationships, and summary
     """
-    logger.info(f"Running document-level extraction for {base_id}")
+    logger.info("Running document-level extraction for %s", base_id)
 
     full_text = last_chunk_text
     if all_chunks:
         full_text = "\n\n".join(all_chunks)
     elif total_chunks > 1:
         logger.warning(
-            f"Document {base_id} has {total_chunks} chunks, but only last chunk text "
-            f"is available for tier-3 extraction because allChunks is missing from task payload."
+            "Document %s has %s chunks, but only last chunk text "
+            "is available for tier-3 extraction because allChunks is missing from task payload.",
+            base_id,
+            total_chunks,
         )
 
     try:
         # Type-specific metadata extraction
-        schema_cls, prompt_template = get_schema_for_doctype(doc_type)
-        schema_dict = schema_cls.model_json_schema()
+        schema_dict, prompt_template, schema_json = get_json_schema_for_doctype(doc_type)
 
-        tier3_meta = await adapter.extract_metadata(
-            full_text, doc_type, schema_dict, prompt_template
+        # Metadata, entities and relationships; fused into one request when the
+        # adapter supports it, otherwise concurrent calls that tolerate one failing
+        tier3_meta, entity_result = await get_adapter().extract_all(
+            full_text, doc_type, schema_dict, prompt_template, schema_json
         )
         tier3_meta = _normalize_tier3_metadata(tier3_meta)
 
-        # Entity + relationship extraction
-        entity_result = await adapter.extract_entities(full_text)
-
         # Extract summary (prefer summary_medium for downstream use)
         summary = str(tier3_meta.get("summary_medium") or tier3_meta.get("summary") or "")
 
@@ -272,8 +481,10 @@ async def run_document_level_extraction(
                 )
 
         logger.info(
-            f"Completed document-level extraction for {base_id}: "
-            f"{len(entities)} entities, {len(relationships)} relationships"
+            "Completed document-level extraction for %s: %d entities, %d relationships",
+            base_id,
+            len(entities),
+            len(relationships),
         )
 
         return {
@@ -284,5 +495,5 @@ async def run_document_level_extraction(
         }
 
     except Exception as e:
-        logger.error(f"Document-level extraction failed for {base_id}: {e}", exc_info=True)
+        logger.error("Document-level extraction failed for %s: %s", base_id, e, exc_info=True)
         raise
@@ -1,7 +1,54 @@
 """Schema router and registry."""
 
+import copy
+
+import orjson
 from pydantic import BaseModel
 
+from src.schemas.article import PROMPT as ARTICLE_PROMPT
+from src.schemas.article import ArticleMetadata
+from src.schemas.code import PROMPT as CODE_PROMPT
+from src.schemas.code import CodeMetadata
+from src.schemas.email import PROMPT as EMAIL_PROMPT
+from src.schemas.email import EmailMetadata
+from src.schemas.image import PROMPT as IMAGE_PROMPT
+from src.schemas.image import ImageMetadata
+from src.schemas.meeting import PROMPT as MEETING_PROMPT
+from src.schemas.meeting import MeetingMetadata
+from src.schemas.pdf import PROMPT as PDF_PROMPT
+from src.schemas.pdf import PDFMetadata
+from src.schemas.slack import PROMPT as SLACK_PROMPT
+from src.schemas.slack import SlackMetadata
+from src.schemas.text import PROMPT as TEXT_PROMPT
+from src.schemas.text import TextMetadata
+
+# doc_type -> (schema_class, prompt_template); unknown types use the generic text schema
+_REGISTRY: dict[str, tuple[type[BaseModel], str]] = {
+    "code": (CodeMetadata, CODE_PROMPT),
+    "slack": (SlackMetadata, SLACK_PROMPT),
+    "email": (EmailMetadata, EMAIL_PROMPT),
+    "meeting": (MeetingMetadata, MEETING_PROMPT),
+    "image": (ImageMetadata, IMAGE_PROMPT),
+    "pdf": (PDFMetadata, PDF_PROMPT),
+    "article": (ArticleMetadata, ARTICLE_PROMPT),
+    "text": (TextMetadata, TEXT_PROMPT),
+}
+_FALLBACK = _REGISTRY["text"]
+
+
+def _json_entry(schema_cls: type[BaseModel], prompt: str) -> tuple[dict, str, bytes]:
+    """Build a JSON registry entry: the schema, its prompt and its canonical serialization."""
+    schema = schema_cls.model_json_schema()
+    return schema, prompt, orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)
+
+
+# JSON schemas generated and serialized once at import instead of on every extraction
+_JSON_REGISTRY: dict[str, tuple[dict, str, bytes]] = {
+    doc_type: _json_entry(schema_cls, prompt)
+    for doc_type, (schema_cls, prompt) in _REGISTRY.items()
+}
+_JSON_FALLBACK = _JSON_REGISTRY["text"]
+
 
 def get_schema_for_doctype(doc_type: str) -> tuple[type[BaseModel], str]:
     """Get the Pydantic schema and prompt template for a document type.
@@ -12,52 +59,38 @@ def get_schema_for_doctype(doc_type: str) -> tuple[type[BaseModel], str]:
     Returns:
         Tuple of (schema_class, prompt_template)
     """
-    if doc_type == "code":
-        from src.schemas.code import PROMPT, CodeMetadata
-
-        return CodeMetadata, PROMPT
-
-    elif doc_type == "slack":
-        from src.schemas.slack import PROMPT, SlackMetadata
-
-        return SlackMetadata, PROMPT
-
-    elif doc_type == "email":
-        from src.schemas.email import PROMPT, EmailMetadata
-
-        return EmailMetadata, PROMPT
-
-    elif doc_type == "meeting":
-        from src.schemas.meeting import PROMPT, MeetingMetadata
+    return _REGISTRY.get(doc_type, _FALLBACK)
 
-        return MeetingMetadata, PROMPT
 
-    elif doc_type == "image":
-        from src.schemas.image import PROMPT, ImageMetadata
+def get_json_schema_for_doctype(doc_type: str) -> tuple[dict, str, bytes]:
+    """Get the JSON schema, prompt template and schema key for a document type.
 
-        return ImageMetadata, PROMPT
+    The schema is generated and serialized once per doc type; each caller gets
+    its own copy of the dict, so the cached schema key always matches it.
 
-    elif doc_type == "pdf":
-        from src.schemas.pdf import PROMPT, PDFMetadata
-
-        return PDFMetadata, PROMPT
+    Args:
+        doc_type: Document type (code, slack, email, meeting, image, pdf, article, text)
 
-    elif doc_type == "article":
-        from src.schemas.article import PROMPT, ArticleMetadata
+    Returns:
+        Tuple of (json_schema, prompt_template, schema_json)
+    """
+    schema, prompt, schema_json = _JSON_REGISTRY.get(doc_type, _JSON_FALLBACK)
+    return copy.deepcopy(schema), prompt, schema_json
 
-        return ArticleMetadata, PROMPT
 
-    elif doc_type == "text":
-        # Explicit handling for generic text
-        from src.schemas.text import PROMPT, TextMetadata
+def schema_cache_key(schema: dict) -> bytes:
+    """Serialize a JSON schema canonically, for keying caches of derived artifacts.
 
-        return TextMetadata, PROMPT
+    Registry schemas come with this key from get_json_schema_for_doctype; use
+    this for any other schema.
 
-    else:
-        # Fallback for unknown types - use generic text schema
-        from src.schemas.text import PROMPT, TextMetadata
+    Args:
+        schema: JSON schema dict
 
-        return TextMetadata, PROMPT
+    Returns:
+        The schema as JSON bytes with sorted keys
+    """
+    return orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)
 
 
-__all__ = ["get_schema_for_doctype"]
+__all__ = ["get_json_schema_for_doctype", "get_schema_for_doctype", "schema_cache_key"]
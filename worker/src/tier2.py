@@ -5,8 +5,17 @@ import threading
 
 import spacy
 
+from src.config import NLP_BATCH_SIZE, NLP_GPU
+
 logger = logging.getLogger(__name__)
 
+# langdetect converges well within this many characters; the rest of a chunk adds nothing
+_LANGUAGE_SAMPLE_CHARS = 1024
+
+# Components NER depends on; the rest (tagger, parser, lemmatizer, TextRank)
+# only feed keywords. TextRank in turn needs every component, entities included.
+_NER_PIPES = ("tok2vec", "ner")
+
 # Module-level state for lazy loading
 _nlp: spacy.Language | None = None
 _nlp_lock = threading.Lock()
@@ -20,6 +29,9 @@ def _get_nlp() -> spacy.Language:
         with _nlp_lock:
             if _nlp is None:  # Double-check after acquiring lock
                 try:
+                    # Must precede spacy.load so the model is allocated on the GPU
+                    if NLP_GPU and not spacy.prefer_gpu():
+                        logger.warning("NLP_GPU is set but no GPU is available; using CPU")
                     _nlp = spacy.load("en_core_web_sm")
                     # Initialize TextRank once during setup
                     import pytextrank  # noqa: F401 - side-effect import for spacy pipeline
@@ -35,6 +47,15 @@ def _get_nlp() -> spacy.Language:
     return _nlp
 
 
+def warmup() -> None:
+    """Load the spaCy pipeline and run one throwaway text through every component.
+
+    Raises:
+        RuntimeError: If the spaCy model is not installed
+    """
+    process_texts_nlp_batch(["Warm up the pipeline."])
+
+
 def extract_entities(text: str) -> list[dict[str, str]]:
     """Extract named entities from text using spaCy.
 
@@ -46,10 +67,8 @@ def extract_entities(text: str) -> list[dict[str, str]]:
     """
     if not text or not text.strip():
         return []
-
-    nlp = _get_nlp()
-    doc = nlp(text)
-    return [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+    disable = [name for name in _get_nlp().pipe_names if name not in _NER_PIPES]
+    return process_texts_nlp_batch([text], disable=disable)[0]["entities"]
 
 
 def extract_keywords(text: str, top_n: int = 10) -> list[str]:
@@ -62,21 +81,7 @@ def extract_keywords(text: str, top_n: int = 10) -> list[str]:
     Returns:
         List of keyword phrases
     """
-    if not text or not text.strip():
-        return []
-
-    nlp = _get_nlp()
-    doc = nlp(text)
-
-    # Extract top phrases
-    phrases = []
-    if not doc.has_extension("phrases"):
-        logger.debug("spaCy Doc extension 'phrases' is not registered; returning no keywords")
-        return phrases
-    for phrase in doc._.phrases[:top_n]:
-        phrases.append(phrase.text)
-
-    return phrases
+    return process_texts_nlp_batch([text], top_n=top_n)[0]["keywords"]
 
 
 def detect_language(text: str) -> str:
@@ -93,8 +98,8 @@ def detect_language(text: str) -> str:
     # Set seed for reproducibility
     DetectorFactory.seed = 0
 
-    # Normalize text
-    normalized = text.replace("\n", " ").strip()
+    # Normalize a leading sample of the text
+    normalized = text[:_LANGUAGE_SAMPLE_CHARS].replace("\n", " ").strip()
     if not normalized:
         return "unknown"
 
@@ -122,21 +127,60 @@ def process_text_nlp(text: str) -> dict:
     Returns:
         Dictionary with 'entities' and 'keywords' lists
     """
-    if not text or not text.strip():
-        return {"entities": [], "keywords": []}
+    return process_texts_nlp_batch([text])[0]
+
 
-    nlp = _get_nlp()
-    doc = nlp(text)
+def process_texts_nlp_batch(
+    texts: list[str],
+    batch_size: int = NLP_BATCH_SIZE,
+    top_n: int = 10,
+    n_process: int = 1,
+    disable: list[str] | None = None,
+) -> list[dict]:
+    """Process several texts with one nlp.pipe pass for entities and keywords.
+
+    Batching amortizes spaCy's per-call overhead across texts; the single-text
+    helpers above are one-element calls into it.
+
+    Args:
+        texts: Input texts to analyze
+        batch_size: Texts per spaCy minibatch
+        top_n: Number of top keywords to return per text
+        n_process: spaCy worker processes for bulk runs. Each process receives
+            whole minibatches, so keep batch_size small enough that every
+            process gets work (len(texts) >= batch_size * n_process). The
+            worker's tier-2 path keeps 1 and scales with NLP_PROCESSES instead.
+        disable: Pipeline components to skip for this call only; results from
+            skipped components come back empty
 
+    Returns:
+        One dictionary with 'entities' and 'keywords' lists per text, in input order
+    """
+    results = [{"entities": [], "keywords": []} for _ in texts]
+    indexes = [i for i, text in enumerate(texts) if text and text.strip()]
+    if indexes:
+        docs = _get_nlp().pipe(
+            (texts[i] for i in indexes),
+            batch_size=batch_size,
+            n_process=n_process,
+            disable=disable or [],
+        )
+        for i, doc in zip(indexes, docs, strict=True):
+            results[i] = _nlp_result(doc, top_n)
+    return results
+
+
+def _nlp_result(doc: spacy.tokens.Doc, top_n: int = 10) -> dict:
+    """Collect entities and TextRank keywords from a processed doc."""
     # Extract entities
     entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
 
     # Extract keywords from TextRank
     keywords = []
-    if not doc.has_extension("phrases"):
+    if not doc.has_extension("phrases") or doc._.phrases is None:
         logger.debug("spaCy Doc extension 'phrases' is not registered; returning no keywords")
         return {"entities": entities, "keywords": keywords}
-    for phrase in doc._.phrases[:10]:  # Top 10 keywords
+    for phrase in doc._.phrases[:top_n]:
         keywords.append(phrase.text)
 
     return {"entities": entities, "keywords": keywords}
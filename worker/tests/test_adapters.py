@@ -1,13 +1,29 @@
 """Tests for LLM adapters."""
 
+import asyncio
+import base64
+import io
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import httpx
+import openai
+import orjson
 import pytest
-
-from src.adapters import get_adapter
-from src.adapters.base import ImageDescription
+import tiktoken
+from PIL import Image
+
+from src.adapters import get_adapter, reset_adapter
+from src.adapters.anthropic import AnthropicAdapter
+from src.adapters.base import (
+    ImageDescription,
+    first_json_object,
+    fused_extraction_schema,
+    schema_for_prompt,
+)
+from src.adapters.cache import DiskCache, ResponseCache
 from src.adapters.ollama import OllamaAdapter, _normalize_ollama_base_url
-from src.adapters.openai import OpenAIAdapter
+from src.adapters.openai import OpenAIAdapter, _json_schema_response_format
+from src.schemas import schema_cache_key
 
 
 def _make_openai_response(content: str) -> MagicMock:
@@ -113,6 +129,7 @@ async def test_ollama_adapter_describe_image():
 
 def test_get_adapter_default():
     """Test adapter factory returns Ollama by default."""
+    reset_adapter()
     with patch("src.adapters.EXTRACTOR_PROVIDER", "ollama"):
         adapter = get_adapter()
         assert isinstance(adapter, OllamaAdapter)
@@ -120,6 +137,7 @@ def test_get_adapter_default():
 
 def test_get_adapter_ollama():
     """Test adapter factory returns Ollama when configured."""
+    reset_adapter()
     with patch("src.adapters.EXTRACTOR_PROVIDER", "ollama"):
         adapter = get_adapter()
         assert isinstance(adapter, OllamaAdapter)
@@ -127,6 +145,7 @@ def test_get_adapter_ollama():
 
 def test_get_adapter_openai():
     """Test adapter factory returns OpenAIAdapter when configured."""
+    reset_adapter()
     with (
         patch("src.adapters.EXTRACTOR_PROVIDER", "openai"),
         patch("src.adapters.openai.OPENAI_API_KEY", "sk-test"),
@@ -148,7 +167,9 @@ async def test_openai_adapter_json_mode_fallback():
 
     with patch.object(adapter.client.chat.completions, "create", new=create_mock):
         schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
-        result = await adapter._extract_structured("test prompt", schema, "test-model")
+        result = await adapter._extract_structured(
+            "test prompt", schema_cache_key(schema), "test-model"
+        )
 
         assert result == {"summary": "fallback result"}
         assert create_mock.call_count == 2
@@ -273,3 +294,532 @@ def test_openai_adapter_no_fail_fast_with_local_url():
     """Test OpenAIAdapter does NOT raise when using a local/custom base_url without a key."""
     adapter = OpenAIAdapter(base_url="http://localhost:11434/v1")
     assert adapter is not None
+
+
+@pytest.mark.asyncio
+async def test_extract_metadata_bounded_by_semaphore():
+    """Test the adapter semaphore caps concurrent provider requests."""
+    adapter = OpenAIAdapter(base_url="http://localhost:11434/v1")
+    adapter._semaphore = asyncio.Semaphore(2)
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+    in_flight = 0
+    peak = 0
+
+    async def fake_create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _make_openai_response('{"summary": "ok"}')
+
+    with patch.object(adapter.client.chat.completions, "create", new=fake_create):
+        results = await asyncio.gather(
+            *(adapter.extract_metadata(f"text-{i}", "text", schema) for i in range(6))
+        )
+
+    assert len(results) == 6
+    assert peak == 2
+
+
+def test_ollama_adapter_keeps_connections_warm():
+    """Test OllamaAdapter pools keep-alive connections sized to LLM concurrency."""
+    with patch("src.adapters.ollama.LLM_CONCURRENCY", 8):
+        adapter = OllamaAdapter()
+
+    pool = adapter.client._client._transport._pool
+    assert pool._max_connections == 8
+    assert pool._max_keepalive_connections == 8
+    assert pool._keepalive_expiry == 60.0
+
+
+@pytest.mark.asyncio
+async def test_adapter_aclose_closes_client():
+    """Test aclose releases the provider client."""
+    adapter = OllamaAdapter()
+
+    await adapter.aclose()
+
+    assert adapter.client.is_closed()
+
+
+@pytest.mark.asyncio
+async def test_anthropic_adapter_caches_instruction_prefix():
+    """Test Anthropic requests put instructions in a cached system block."""
+    with patch("src.adapters.anthropic.ANTHROPIC_API_KEY", "sk-ant-test"):
+        adapter = AnthropicAdapter()
+
+    tool_use = MagicMock(type="tool_use", input={"summary": "ok"})
+    create_mock = AsyncMock(return_value=MagicMock(content=[tool_use]))
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+
+    with patch.object(adapter.client.messages, "create", new=create_mock):
+        result = await adapter.extract_metadata(
+            "document body", "code", schema, "Summarize:\n{text}\n\nSchema: {schema}"
+        )
+
+    assert result == {"summary": "ok"}
+    kwargs = create_mock.call_args[1]
+    system_block = kwargs["system"][0]
+    assert system_block["cache_control"] == {"type": "ephemeral"}
+    assert "document body" not in system_block["text"]
+    assert kwargs["messages"] == [{"role": "user", "content": "document body"}]
+
+
+def test_response_cache_evicts_lru_and_expired_entries():
+    """Test ResponseCache honours its size bound and TTL."""
+    cache = ResponseCache(max_size=2, ttl_seconds=60)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+
+    with patch("src.adapters.cache.time.monotonic", return_value=float("inf")):
+        assert cache.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_openai_adapter_serves_repeated_prompt_from_cache():
+    """Test identical extractions hit the provider once and return independent copies."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"tags": {"type": "array"}}}
+    create_mock = AsyncMock(return_value=_make_openai_response('{"tags": ["a"]}'))
+
+    with patch.object(adapter.client.chat.completions, "create", new=create_mock):
+        first = await adapter.extract_metadata("same text", "text", schema)
+        first["tags"].append("mutated")
+        second = await adapter.extract_metadata("same text", "text", schema)
+
+    assert create_mock.call_count == 1
+    assert second == {"tags": ["a"]}
+
+
+@pytest.mark.asyncio
+async def test_openai_adapter_rejects_response_violating_schema():
+    """Test a response that does not match the schema falls back to the empty shape."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"tags": {"type": "array"}}}
+    create_mock = AsyncMock(return_value=_make_openai_response('{"tags": "not-a-list"}'))
+
+    with patch.object(adapter.client.chat.completions, "create", new=create_mock):
+        result = await adapter.extract_metadata("text", "text", schema)
+
+    assert create_mock.call_count == 2
+    assert result == {"tags": []}
+
+
+def test_openai_adapter_memoizes_metadata_prompt_skeleton():
+    """Test the schema is rendered once per doc type and only the text varies."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+
+    with patch("src.adapters.openai.schema_for_prompt", wraps=schema_for_prompt) as render_schema:
+        first = adapter._metadata_prompt("alpha", "code", schema, schema_cache_key(schema), "")
+        second = adapter._metadata_prompt(
+            "beta", "code", dict(schema), schema_cache_key(dict(schema)), ""
+        )
+
+    assert "alpha" in first and "beta" in second
+    assert first.replace("alpha", "beta") == second
+    assert render_schema.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    """Test in-flight duplicates await a single provider call and get their own copies."""
+    adapter = OllamaAdapter()
+    adapter._cache.max_size = 0
+    schema = {"type": "object", "properties": {"tags": {"type": "array"}}}
+    calls = 0
+
+    async def fake_create(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return _make_openai_response('{"tags": ["a"]}')
+
+    with patch.object(adapter.client.chat.completions, "create", new=fake_create):
+        results = await asyncio.gather(
+            *(adapter.extract_metadata("same text", "text", schema) for _ in range(5))
+        )
+
+    assert calls == 1
+    assert results == [{"tags": ["a"]}] * 5
+    assert len({id(r) for r in results}) == 5
+    assert adapter._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_call_to_waiting_duplicate():
+    """Test cancelling the caller that owns an in-flight request does not cancel its followers."""
+    adapter = OllamaAdapter()
+    adapter._cache.max_size = 0
+    schema = {"type": "object", "properties": {"tags": {"type": "array"}}}
+    started = asyncio.Event()
+    calls = 0
+
+    async def fake_create(**kwargs):
+        nonlocal calls
+        calls += 1
+        started.set()
+        await asyncio.sleep(0.01)
+        return _make_openai_response('{"tags": ["a"]}')
+
+    with patch.object(adapter.client.chat.completions, "create", new=fake_create):
+        leader = asyncio.create_task(adapter.extract_metadata("same text", "text", schema))
+        await started.wait()
+        follower = asyncio.create_task(adapter.extract_metadata("same text", "text", schema))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        result = await follower
+
+    assert leader.cancelled()
+    assert result == {"tags": ["a"]}
+    assert calls == 2
+    assert adapter._inflight == {}
+
+
+def test_truncate_to_tokens_counts_model_tokens():
+    """Test document text is cut at the token budget rather than a character count."""
+    adapter = OllamaAdapter()
+    byte_encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+    with (
+        patch("src.adapters.base._encoding_for_model", return_value=byte_encoding),
+        patch("src.adapters.base.EXTRACTOR_MAX_INPUT_TOKENS", 5),
+    ):
+        assert adapter._truncate_to_tokens("abc", "llama3") == "abc"
+        assert adapter._truncate_to_tokens("abcdefgh", "llama3") == "abcde"
+
+
+def test_truncate_to_tokens_without_tokenizer_falls_back_to_characters():
+    """Test truncation still bounds the text when no tokenizer can be loaded."""
+    adapter = OllamaAdapter()
+
+    with (
+        patch("src.adapters.base._encoding_for_model", return_value=None),
+        patch("src.adapters.base.EXTRACTOR_MAX_INPUT_TOKENS", 5),
+    ):
+        assert adapter._truncate_to_tokens("x" * 100, "llama3") == "x" * 20
+
+
+def test_hosted_adapters_negotiate_http2():
+    """Test OpenAI and Anthropic clients are built with HTTP/2 enabled."""
+    with patch("src.adapters.openai.OPENAI_API_KEY", "sk-test"):
+        openai_adapter = OpenAIAdapter()
+    with patch("src.adapters.anthropic.ANTHROPIC_API_KEY", "sk-ant-test"):
+        anthropic_adapter = AnthropicAdapter()
+
+    for adapter in (openai_adapter, anthropic_adapter):
+        assert adapter.client._client._transport._pool._http2 is True
+
+
+def _encode_image(image: Image.Image, fmt: str) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_prepare_image_downscales_keeping_png_transparency():
+    """Test oversized PNGs shrink to max_image_dim and stay PNG with their alpha."""
+    adapter = OllamaAdapter()
+    original = _encode_image(Image.new("RGBA", (4000, 1000), (255, 0, 0, 128)), "PNG")
+
+    data, media_type = adapter._prepare_image(original)
+    prepared = Image.open(io.BytesIO(base64.b64decode(data)))
+
+    assert media_type == "image/png"
+    assert prepared.format == "PNG"
+    assert prepared.mode == "RGBA"
+    assert prepared.size == (adapter.max_image_dim, adapter.max_image_dim // 4)
+
+
+def test_prepare_image_downscales_jpeg_as_jpeg():
+    """Test oversized JPEGs are shrunk and stay JPEG."""
+    adapter = OllamaAdapter()
+    original = _encode_image(Image.new("RGB", (1000, 4000), (0, 128, 0)), "JPEG")
+
+    data, media_type = adapter._prepare_image(original)
+    prepared = Image.open(io.BytesIO(base64.b64decode(data)))
+
+    assert media_type == "image/jpeg"
+    assert prepared.format == "JPEG"
+    assert prepared.size == (adapter.max_image_dim // 4, adapter.max_image_dim)
+
+
+def test_prepare_image_keeps_images_within_bounds():
+    """Test in-bounds images are sent untouched with their own media type."""
+    adapter = OllamaAdapter()
+    png = _encode_image(Image.new("RGBA", (200, 100), (0, 0, 0, 0)), "PNG")
+
+    assert adapter._prepare_image(png) == (png, "image/png")
+    assert adapter._prepare_image("not-an-image") == ("not-an-image", "image/jpeg")
+
+
+def test_json_schema_response_format_is_strict():
+    """Test schemas are rewritten so every object is closed and fully required."""
+    schema = {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string", "default": ""},
+            "owner": {"anyOf": [{"type": "string"}, {"type": "null"}], "default": None},
+            "items": {"type": "array", "items": {"$ref": "#/$defs/Item"}},
+        },
+        "$defs": {"Item": {"type": "object", "properties": {"task": {"type": "string"}}}},
+    }
+
+    response_format = _json_schema_response_format(schema_cache_key(schema))
+    strict_schema = response_format["json_schema"]["schema"]
+
+    assert response_format["json_schema"]["strict"] is True
+    assert strict_schema["additionalProperties"] is False
+    assert strict_schema["required"] == ["items", "owner", "summary"]
+    assert "default" not in strict_schema["properties"]["owner"]
+    assert strict_schema["$defs"]["Item"]["required"] == ["task"]
+    assert strict_schema["$defs"]["Item"]["additionalProperties"] is False
+    assert "required" not in schema["$defs"]["Item"]
+
+
+@pytest.mark.asyncio
+async def test_openai_adapter_skips_fallback_on_permanent_error():
+    """Test errors a plainer request cannot fix are not re-sent."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+    not_found = openai.NotFoundError(
+        "model not found",
+        response=httpx.Response(404, request=httpx.Request("POST", "http://ollama/v1")),
+        body=None,
+    )
+    create_mock = AsyncMock(side_effect=not_found)
+
+    with patch.object(adapter.client.chat.completions, "create", new=create_mock):
+        result = await adapter.extract_metadata("text", "text", schema)
+
+    assert create_mock.call_count == 1
+    assert result == {"summary": ""}
+
+
+def test_empty_response_for_schema_fills_nested_objects():
+    """Test the empty shape recurses into nested objects and is never shared."""
+    adapter = OllamaAdapter()
+    schema = {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "tags": {"type": "array"},
+            "invoice": {"type": "object", "properties": {"number": {"type": "string"}}},
+            "count": {"type": "integer"},
+        },
+    }
+
+    first = adapter._empty_response_for_schema(schema_cache_key(schema))
+    first["tags"].append("x")
+
+    assert adapter._empty_response_for_schema(schema_cache_key(schema)) == {
+        "summary": "",
+        "tags": [],
+        "invoice": {"number": ""},
+    }
+
+
+def test_get_adapter_returns_shared_instance():
+    """Test the factory shares one adapter until it is reset."""
+    reset_adapter()
+    with patch("src.adapters.EXTRACTOR_PROVIDER", "ollama"):
+        adapter = get_adapter()
+        assert get_adapter() is adapter
+        reset_adapter()
+        assert get_adapter() is not adapter
+    reset_adapter()
+
+
+def test_adapter_classes_resolve_lazily():
+    """Test provider adapter classes are reachable from the package."""
+    import src.adapters
+
+    assert src.adapters.AnthropicAdapter is AnthropicAdapter
+    assert src.adapters.OllamaAdapter is OllamaAdapter
+    with pytest.raises(AttributeError):
+        src.adapters.MissingAdapter  # noqa: B018
+
+
+def test_anthropic_parse_image_description_heuristic_fallback():
+    """Test non-JSON descriptions yield deduplicated object words from object lines."""
+    with patch("src.adapters.anthropic.ANTHROPIC_API_KEY", "sk-ant-test"):
+        adapter = AnthropicAdapter()
+    text = "A sunny park scene.\nVisible objects: bench, tree, bench, dog.\nNo text shown."
+
+    result = adapter._parse_image_description(text)
+
+    assert result["description"] == text
+    assert result["detected_objects"] == ["bench", "tree"]
+
+
+@pytest.mark.asyncio
+async def test_describe_image_cache_hit_returns_equal_description():
+    """Test a cached image description round-trips without another provider call."""
+    adapter = OllamaAdapter()
+    create_mock = AsyncMock(
+        return_value=_make_openai_response(
+            '{"description": "A cat", "detected_objects": ["cat"], "image_type": "photo"}'
+        )
+    )
+
+    with patch.object(adapter.client.chat.completions, "create", new=create_mock):
+        first = await adapter.describe_image("aW1hZ2U=")
+        second = await adapter.describe_image("aW1hZ2U=")
+
+    assert create_mock.call_count == 1
+    assert second == first
+    assert ImageDescription.empty() == ImageDescription(description="")
+
+
+def test_disk_cache_persists_and_bounds_entries(tmp_path):
+    """Test DiskCache survives reopening and keeps only the newest entries."""
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"key": key})
+    cache.close()
+
+    reopened = DiskCache(str(tmp_path), max_entries=2)
+    assert reopened.get("a") is None
+    assert reopened.get("c") == {"key": "c"}
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_describe_image_reuses_persisted_description(tmp_path):
+    """Test a new adapter serves a previously described image from disk."""
+    create_mock = AsyncMock(
+        return_value=_make_openai_response('{"description": "A logo", "image_type": "diagram"}')
+    )
+
+    with patch("src.adapters.base.IMAGE_CACHE_DIR", str(tmp_path)):
+        first_adapter = OllamaAdapter()
+        second_adapter = OllamaAdapter()
+
+    with patch.object(first_adapter.client.chat.completions, "create", new=create_mock):
+        await first_adapter.describe_image("bG9nbw==")
+    with patch.object(second_adapter.client.chat.completions, "create", new=create_mock):
+        result = await second_adapter.describe_image("bG9nbw==")
+
+    assert create_mock.call_count == 1
+    assert result.description == "A logo"
+    await first_adapter.aclose()
+    await second_adapter.aclose()
+
+
+def test_anthropic_tool_request_honours_parallel_tool_calls():
+    """Test PARALLEL_TOOL_CALLS maps onto Anthropic's tool_choice only when set."""
+    with patch("src.adapters.anthropic.ANTHROPIC_API_KEY", "sk-ant-test"):
+        adapter = AnthropicAdapter()
+    schema = {"type": "object", "properties": {}}
+
+    default_params = adapter._tool_request_params("i", "t", schema, "tool", "model")
+    with patch("src.adapters.anthropic.PARALLEL_TOOL_CALLS", False):
+        disabled_params = adapter._tool_request_params("i", "t", schema, "tool", "model")
+
+    assert "tool_choice" not in default_params
+    assert disabled_params["tool_choice"] == {"type": "auto", "disable_parallel_tool_use": True}
+
+
+def test_schema_for_prompt_is_compact_and_unannotated():
+    """Test prompt schemas drop titles/descriptions but keep same-named properties."""
+    schema = {
+        "title": "Doc",
+        "description": "A document.",
+        "type": "object",
+        "properties": {
+            "title": {"title": "Title", "type": "string"},
+            "description": {"type": "string", "description": "Body"},
+        },
+    }
+
+    rendered = schema_for_prompt(schema)
+
+    assert orjson.loads(rendered) == {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "description": {"type": "string"}},
+    }
+    assert "\n" not in rendered
+    with patch("src.adapters.base.PRETTY_SCHEMA", True):
+        assert orjson.loads(schema_for_prompt(schema)) == schema
+
+
+def test_first_json_object_skips_prose_and_later_braces():
+    """Test the first well-formed object is found despite surrounding brace regions."""
+    text = 'Here {not json} is the result: {"description": "A {cat}"} and {"other": 1}'
+
+    assert first_json_object(text) == {"description": "A {cat}"}
+    assert first_json_object("no braces at all") is None
+
+
+@pytest.mark.asyncio
+async def test_openai_adapter_fused_extraction_makes_one_request():
+    """Test EXTRACTOR_FUSED asks for metadata and entities in a single request."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+    content = orjson.dumps(
+        {
+            "metadata": {"summary": "Doc"},
+            "entities": [{"name": "Alice", "type": "person", "description": "Author"}],
+            "relationships": [],
+        }
+    ).decode()
+    create_mock = AsyncMock(return_value=_make_openai_response(content))
+
+    with (
+        patch("src.adapters.openai.EXTRACTOR_FUSED", True),
+        patch.object(adapter.client.chat.completions, "create", new=create_mock),
+    ):
+        metadata, entity_result = await adapter.extract_all("Alice wrote this.", "text", schema)
+
+    assert create_mock.call_count == 1
+    assert create_mock.call_args.kwargs["model"] == adapter.capable_model
+    assert metadata == {"summary": "Doc"}
+    assert entity_result["entities"][0]["name"] == "Alice"
+    assert entity_result["relationships"] == []
+
+
+def test_fused_extraction_schema_hoists_defs():
+    """Test the metadata schema nests under 'metadata' with its $defs kept at the root."""
+    schema = {
+        "type": "object",
+        "properties": {"items": {"type": "array", "items": {"$ref": "#/$defs/Item"}}},
+        "$defs": {"Item": {"type": "object", "properties": {"task": {"type": "string"}}}},
+    }
+    entity_schema = {
+        "type": "object",
+        "properties": {"entities": {"type": "array"}, "relationships": {"type": "array"}},
+        "required": ["entities", "relationships"],
+    }
+
+    fused = fused_extraction_schema(schema, entity_schema)
+
+    assert fused["required"] == ["metadata", "entities", "relationships"]
+    assert "$defs" not in fused["properties"]["metadata"]
+    assert fused["$defs"] == schema["$defs"]
+    assert fused["properties"]["metadata"]["properties"] == schema["properties"]
+
+
+def test_openai_adapter_inserts_text_verbatim_into_template():
+    """Test template prompts are split around {text}, so braces in the text survive."""
+    adapter = OllamaAdapter()
+    schema = {"type": "object", "properties": {"summary": {"type": "string"}}}
+    template = "Before\n{text}\nSchema: {schema}"
+
+    prompt = adapter._metadata_prompt(
+        "uses {text} and {schema}", "code", schema, schema_cache_key(schema), template
+    )
+
+    assert prompt.startswith("Before\nuses {text} and {schema}\nSchema: ")
+    assert prompt.count("{text}") == 1
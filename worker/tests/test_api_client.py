@@ -3,12 +3,15 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import httpx
+import orjson
 import pytest
 
 from src.api_client import (
-    claim_task,
+    claim_tasks,
     close_client,
     fail_task,
+    get_client,
+    init_client,
     recover_stale,
     submit_result,
 )
@@ -24,63 +27,86 @@ def mock_httpx_client():
 
 
 @pytest.mark.asyncio
-async def test_claim_task_success(mock_httpx_client):
-    """Test successful task claim."""
+async def test_claim_tasks_orders_sparse_chunks(mock_httpx_client):
+    """Test chunk texts are ordered by index when the list has gaps."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {
-        "task": {
-            "id": "task-uuid-123",
-            "payload": {
-                "baseId": "doc-123",
-                "chunkIndex": 0,
-                "totalChunks": 2,
-                "docType": "text",
-                "collection": "default",
-            },
-            "attempt": 1,
-        },
-        "chunks": [
-            {"chunkIndex": 0, "text": "First chunk text"},
-            {"chunkIndex": 1, "text": "Second chunk text"},
-        ],
-    }
+    mock_response.content = orjson.dumps(
+        {
+            "tasks": [
+                {
+                    "task": {"id": "task-1", "payload": {"chunkIndex": 2}, "attempt": 1},
+                    "chunks": [
+                        {"chunkIndex": 3, "text": "third"},
+                        {"chunkIndex": 0, "text": "first"},
+                        {"chunkIndex": 2, "text": "second"},
+                    ],
+                }
+            ]
+        }
+    )
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
     with patch("src.api_client.get_client", return_value=mock_httpx_client):
-        task = await claim_task("worker-1")
+        (task,) = await claim_tasks("worker-1", 1)
+
+    assert task["text"] == "second"
+    assert task["allChunks"] == ["first", "second", "third"]
+
+
+@pytest.mark.asyncio
+async def test_claim_tasks_batch(mock_httpx_client):
+    """Test claiming several tasks in one request."""
+    mock_response = MagicMock()
+    mock_response.content = orjson.dumps(
+        {
+            "tasks": [
+                {
+                    "task": {"id": "t1", "payload": {"chunkIndex": 0}, "attempt": 1},
+                    "chunks": [{"chunkIndex": 0, "text": "a0"}, {"chunkIndex": 1, "text": "a1"}],
+                },
+                {
+                    "task": {"id": "t2", "payload": {"chunkIndex": 1}, "attempt": 2},
+                    "chunks": [{"chunkIndex": 0, "text": "a0"}, {"chunkIndex": 1, "text": "a1"}],
+                },
+            ]
+        }
+    )
+    mock_response.raise_for_status = MagicMock()
+    mock_httpx_client.post.return_value = mock_response
 
-    assert task is not None
-    assert task["taskId"] == "task-uuid-123"
-    assert task["baseId"] == "doc-123"
-    assert task["chunkIndex"] == 0
-    assert task["totalChunks"] == 2
-    assert task["text"] == "First chunk text"
-    assert task["allChunks"] == ["First chunk text", "Second chunk text"]
-    assert task["attempt"] == 1
+    with patch("src.api_client.get_client", return_value=mock_httpx_client):
+        tasks = await claim_tasks("worker-1", 4, 20000)
 
+    assert [t["taskId"] for t in tasks] == ["t1", "t2"]
+    assert [t["text"] for t in tasks] == ["a0", "a1"]
+    assert tasks[1]["attempt"] == 2
+    assert tasks[0]["allChunks"] == ["a0", "a1"]
     mock_httpx_client.post.assert_called_once_with(
-        "/internal/tasks/claim",
-        json={"workerId": "worker-1", "leaseDuration": 300},
+        "/internal/tasks/claim-batch",
+        content=orjson.dumps(
+            {"workerId": "worker-1", "leaseDuration": 300, "maxTasks": 4, "waitMs": 20000}
+        ),
+        headers={"Content-Type": "application/json"},
     )
 
 
 @pytest.mark.asyncio
-async def test_claim_task_no_tasks_available(mock_httpx_client):
+async def test_claim_tasks_no_tasks_available(mock_httpx_client):
     """Test task claim when no tasks available."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {}  # Empty response when no tasks
+    mock_response.content = orjson.dumps({"tasks": []})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
     with patch("src.api_client.get_client", return_value=mock_httpx_client):
-        task = await claim_task("worker-1")
+        tasks = await claim_tasks("worker-1", 4)
 
-    assert task is None
+    assert tasks == []
 
 
 @pytest.mark.asyncio
-async def test_claim_task_http_error(mock_httpx_client):
+async def test_claim_tasks_http_error(mock_httpx_client):
     """Test task claim with HTTP error."""
     mock_response = MagicMock()
     mock_response.status_code = 500
@@ -92,14 +118,14 @@ async def test_claim_task_http_error(mock_httpx_client):
 
     with patch("src.api_client.get_client", return_value=mock_httpx_client):
         with pytest.raises(httpx.HTTPStatusError):
-            await claim_task("worker-1")
+            await claim_tasks("worker-1", 4)
 
 
 @pytest.mark.asyncio
 async def test_submit_result_success(mock_httpx_client):
     """Test successful result submission."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {"ok": True}
+    mock_response.content = orjson.dumps({"ok": True})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
@@ -124,7 +150,7 @@ async def test_submit_result_success(mock_httpx_client):
     call_args = mock_httpx_client.post.call_args
     assert call_args[0][0] == "/internal/tasks/task-123/result"
 
-    payload = call_args[1]["json"]
+    payload = orjson.loads(call_args[1]["content"])
     assert payload["chunkId"] == "doc-123:0"
     assert payload["collection"] == "default"
     assert payload["tier2"] == tier2
@@ -138,7 +164,7 @@ async def test_submit_result_success(mock_httpx_client):
 async def test_submit_result_minimal(mock_httpx_client):
     """Test result submission with only required fields."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {"ok": True}
+    mock_response.content = orjson.dumps({"ok": True})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
@@ -150,18 +176,49 @@ async def test_submit_result_minimal(mock_httpx_client):
         )
 
     call_args = mock_httpx_client.post.call_args
-    payload = call_args[1]["json"]
+    payload = orjson.loads(call_args[1]["content"])
     assert payload["chunkId"] == "doc-123:0"
     assert payload["collection"] == "default"
     assert "tier2" not in payload
     assert "tier3" not in payload
 
 
+@pytest.mark.asyncio
+async def test_submit_result_claims_next_task(mock_httpx_client):
+    """Test a result submission can claim the next task in the same request."""
+    mock_response = MagicMock()
+    mock_response.content = orjson.dumps(
+        {
+            "ok": True,
+            "tasks": [
+                {
+                    "task": {"id": "task-456", "payload": {"chunkIndex": 0}, "attempt": 1},
+                    "chunks": [{"chunkIndex": 0, "text": "next"}],
+                }
+            ],
+        }
+    )
+    mock_response.raise_for_status = MagicMock()
+    mock_httpx_client.post.return_value = mock_response
+
+    with patch("src.api_client.get_client", return_value=mock_httpx_client):
+        next_tasks = await submit_result(
+            task_id="task-123", chunk_id="doc-123:0", collection="default", claim_next=1
+        )
+
+    payload = orjson.loads(mock_httpx_client.post.call_args[1]["content"])
+    assert payload["claimNext"] == 1
+    assert payload["leaseDuration"] == 300
+    assert "workerId" in payload
+    assert [task["taskId"] for task in next_tasks] == ["task-456"]
+    assert next_tasks[0]["text"] == "next"
+
+
 @pytest.mark.asyncio
 async def test_fail_task_success(mock_httpx_client):
     """Test successful task failure reporting."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {"ok": True}
+    mock_response.content = orjson.dumps({"ok": True})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
@@ -170,15 +227,31 @@ async def test_fail_task_success(mock_httpx_client):
 
     mock_httpx_client.post.assert_called_once_with(
         "/internal/tasks/task-123/fail",
-        json={"error": "Test error message"},
+        content=orjson.dumps({"error": "Test error message"}),
+        headers={"Content-Type": "application/json"},
     )
 
 
+@pytest.mark.asyncio
+async def test_fail_task_conflict_is_logged_not_raised(mock_httpx_client, caplog):
+    """Test a failure rejected because the task left processing is only logged."""
+    mock_response = MagicMock()
+    mock_response.status_code = 409
+    mock_response.text = '{"error": "Task task-123 is no longer processing"}'
+    mock_httpx_client.post.return_value = mock_response
+
+    with patch("src.api_client.get_client", return_value=mock_httpx_client):
+        await fail_task("task-123", "Test error message")
+
+    mock_response.raise_for_status.assert_not_called()
+    assert "was not recorded" in caplog.text
+
+
 @pytest.mark.asyncio
 async def test_recover_stale_success(mock_httpx_client):
     """Test successful stale task recovery."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {"recovered": 3}
+    mock_response.content = orjson.dumps({"recovered": 3})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
@@ -193,7 +266,7 @@ async def test_recover_stale_success(mock_httpx_client):
 async def test_recover_stale_no_tasks(mock_httpx_client):
     """Test stale recovery when no tasks recovered."""
     mock_response = MagicMock()
-    mock_response.json.return_value = {"recovered": 0}
+    mock_response.content = orjson.dumps({"recovered": 0})
     mock_response.raise_for_status = MagicMock()
     mock_httpx_client.post.return_value = mock_response
 
@@ -212,3 +285,33 @@ async def test_close_client():
     with patch("src.api_client._client", mock_client):
         await close_client()
         mock_client.aclose.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_client_uses_configured_pool_limits():
+    """Test the shared client pool is sized from config."""
+    with (
+        patch("src.api_client._client", None),
+        patch(
+            "src.api_client.HTTPX_LIMITS",
+            httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        ),
+    ):
+        client = init_client()
+        pool = client._transport._pool
+
+        assert pool._max_connections == 64
+        assert pool._max_keepalive_connections == 32
+        await close_client()
+
+
+@pytest.mark.asyncio
+async def test_get_client_requires_init():
+    """Test requests fail loudly if the client was never initialized."""
+    with patch("src.api_client._client", None):
+        with pytest.raises(RuntimeError, match="not initialized"):
+            get_client()
+
+        client = init_client()
+        assert get_client() is client
+        await close_client()
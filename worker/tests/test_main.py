@@ -0,0 +1,121 @@
+"""Tests for the worker loop."""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src import main
+
+
+@pytest.mark.asyncio
+async def test_worker_task_claims_a_batch_for_free_slots():
+    """The worker claims a batch for its free slots and stops once all are busy."""
+    release = asyncio.Event()
+    active = 0
+    peak = 0
+
+    async def fake_process(task):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await release.wait()
+        active -= 1
+
+    claim = AsyncMock(
+        side_effect=lambda worker_id, max_tasks, wait_ms: [{"taskId": "t"}] * max_tasks
+    )
+    with (
+        patch.object(main, "WORKER_CONCURRENCY", 2),
+        patch.object(main.api_client, "claim_tasks", claim),
+        patch.object(main, "process_task_with_retry", fake_process),
+    ):
+        worker = asyncio.create_task(main.worker_task())
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        # Both slots are filled from a single claim request
+        claim.assert_awaited_once_with(main.WORKER_ID, 2, main.CLAIM_WAIT_MS)
+        assert peak == 2
+
+        release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert claim.await_count > 1
+
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_worker_task_cancels_running_tasks_on_shutdown():
+    """Cancelling the worker cancels the tasks it dispatched."""
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def fake_process(task):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with (
+        patch.object(main, "WORKER_CONCURRENCY", 1),
+        patch.object(main.api_client, "claim_tasks", AsyncMock(return_value=[{"taskId": "t"}])),
+        patch.object(main, "process_task_with_retry", fake_process),
+    ):
+        worker = asyncio.create_task(main.worker_task())
+        await started.wait()
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_worker_task_returns_unused_slots():
+    """Slots not filled by a short batch are available to the next claim."""
+    claim = AsyncMock(side_effect=[[{"taskId": "t"}], [{"taskId": "u"}], []])
+    release = asyncio.Event()
+
+    async def fake_process(task):
+        await release.wait()
+
+    with (
+        patch.object(main, "WORKER_CONCURRENCY", 3),
+        patch.object(main, "CLAIM_WAIT_MS", 0),
+        patch.object(main.api_client, "claim_tasks", claim),
+        patch.object(main, "process_task_with_retry", fake_process),
+    ):
+        worker = asyncio.create_task(main.worker_task())
+        for _ in range(10):
+            await asyncio.sleep(0)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+    assert [call.args[1] for call in claim.await_args_list] == [3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_run_slot_follows_tasks_claimed_with_results():
+    """A slot keeps processing the tasks handed back by result submissions."""
+    process = AsyncMock(side_effect=[[{"taskId": "b"}], [{"taskId": "c"}], []])
+
+    with patch.object(main, "process_task_with_retry", process):
+        await main.run_slot({"taskId": "a"})
+
+    assert [call.args[0]["taskId"] for call in process.await_args_list] == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_process_task_with_retry_returns_no_tasks_on_failure():
+    """A failed task is reported and claims nothing further."""
+    with (
+        patch.object(main, "process_task", AsyncMock(side_effect=RuntimeError("boom"))),
+        patch.object(main.api_client, "fail_task", AsyncMock()) as fail_task,
+    ):
+        assert await main.process_task_with_retry({"taskId": "a"}) == []
+
+    fail_task.assert_awaited_once_with("a", "boom")
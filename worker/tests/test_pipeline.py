@@ -1,9 +1,15 @@
 """Tests for the enrichment pipeline."""
 
-from unittest.mock import AsyncMock, patch
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from src import pipeline
+from src.adapters.base import ExtractorAdapter
 from src.pipeline import (
     _normalize_tier3_metadata,
     process_task,
@@ -21,6 +27,15 @@ except Exception:
     SPACY_AVAILABLE = False
 
 
+@contextmanager
+def _patch_adapter():
+    """Patch the pipeline adapter with a mock that keeps the base extract_all."""
+    mock_adapter = MagicMock()
+    mock_adapter.extract_all = functools.partial(ExtractorAdapter.extract_all, mock_adapter)
+    with patch("src.pipeline.get_adapter", return_value=mock_adapter):
+        yield mock_adapter
+
+
 @pytest.fixture
 def mock_task():
     """Create a mock task."""
@@ -62,12 +77,150 @@ async def test_run_tier2_extraction_empty_text():
     assert result["keywords"] == []
 
 
+@pytest.mark.asyncio
+async def test_run_tier2_extraction_skips_blank_text():
+    """Blank chunks return an empty result without queueing NLP work."""
+    with (
+        patch("src.pipeline.process_texts_nlp_batch") as nlp_batch,
+        patch("src.pipeline.detect_language") as detect,
+    ):
+        result = await run_tier2_extraction(" \n\t ")
+
+    assert result == {"entities": [], "keywords": [], "language": "unknown"}
+    nlp_batch.assert_not_called()
+    detect.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_tier2_extraction_language_failure_keeps_nlp():
+    """A failed language detection does not discard the NLP result."""
+    with (
+        patch(
+            "src.pipeline.process_texts_nlp_batch",
+            return_value=[{"entities": [{"text": "Apple"}], "keywords": ["apple"]}],
+        ),
+        patch("src.pipeline.detect_language", side_effect=RuntimeError("boom")),
+    ):
+        result = await run_tier2_extraction("Apple")
+
+    assert result["entities"] == [{"text": "Apple"}]
+    assert result["keywords"] == ["apple"]
+    assert result["language"] == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_run_tier2_extraction_reuses_document_language():
+    """Later chunks of a document reuse the language detected for an earlier one."""
+    document = ("docs", "repo:language.md")
+    with (
+        patch(
+            "src.pipeline.process_texts_nlp_batch",
+            side_effect=lambda texts, batch_size: [{"entities": [], "keywords": []} for _ in texts],
+        ),
+        patch("src.pipeline.detect_language", return_value="de") as detect,
+    ):
+        first = await run_tier2_extraction("Erster Abschnitt", document)
+        second = await run_tier2_extraction("Zweiter Abschnitt", document)
+        other = await run_tier2_extraction("Anderes Dokument", ("docs", "repo:other.md"))
+
+    assert first["language"] == second["language"] == other["language"] == "de"
+    assert detect.call_count == 2
+    pipeline._document_languages.clear()
+
+
+@pytest.mark.asyncio
+async def test_run_tier2_extraction_batches_queued_texts():
+    """Texts queued behind a running batch share the next nlp.pipe call."""
+    first_started = threading.Event()
+    release_first = threading.Event()
+    batches = []
+
+    def fake_batch(texts, batch_size):
+        batches.append(list(texts))
+        if len(batches) == 1:
+            first_started.set()
+            release_first.wait(5)
+        return [{"entities": [], "keywords": [text]} for text in texts]
+
+    pipeline.init_tier2_batcher()
+    try:
+        with patch("src.pipeline.process_texts_nlp_batch", fake_batch):
+            first = asyncio.create_task(run_tier2_extraction("one"))
+            await asyncio.to_thread(first_started.wait, 5)
+            rest = [asyncio.create_task(run_tier2_extraction(text)) for text in ("two", "three")]
+            await asyncio.sleep(0)
+            release_first.set()
+            results = await asyncio.gather(first, *rest)
+    finally:
+        await pipeline.close_tier2_batcher()
+
+    assert batches == [["one"], ["two", "three"]]
+    assert [result["keywords"] for result in results] == [["one"], ["two"], ["three"]]
+
+
+@pytest.mark.asyncio
+async def test_close_tier2_batcher_cancels_waiting_requests():
+    """Closing the batcher cancels in-flight and queued requests instead of leaving them hanging."""
+    started = asyncio.Event()
+
+    async def stuck_batch(texts, detect):
+        started.set()
+        await asyncio.Event().wait()
+
+    pipeline.init_tier2_batcher()
+    with (
+        patch("src.pipeline._run_tier2_batch", stuck_batch),
+        patch("src.pipeline.NLP_PROCESSES", 0),
+    ):
+        running = asyncio.create_task(run_tier2_extraction("one"))
+        await started.wait()
+        queued = asyncio.create_task(run_tier2_extraction("two"))
+        await asyncio.sleep(0)
+        await pipeline.close_tier2_batcher()
+
+        results = await asyncio.gather(running, queued, return_exceptions=True)
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert pipeline._tier2_batcher is None
+
+
+@pytest.mark.asyncio
+async def test_run_tier2_extraction_in_subprocess():
+    """With NLP_PROCESSES set, tier-2 runs in a spawned subprocess pool."""
+    with patch("src.pipeline.NLP_PROCESSES", 1):
+        try:
+            result = await run_tier2_extraction("123")
+            assert pipeline._nlp_pool is not None
+        finally:
+            pipeline.shutdown_nlp_pool()
+
+    assert set(result) == {"entities", "keywords", "language"}
+    assert result["language"] == "unknown"
+    assert pipeline._nlp_pool is None
+
+
+@pytest.mark.asyncio
+async def test_warm_up_nlp_loads_spacy_in_thread():
+    """Without subprocesses, warm-up loads the shared spaCy pipeline once."""
+    with patch("src.pipeline.tier2.warmup") as warmup:
+        await pipeline.warm_up_nlp()
+
+    warmup.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_nlp_tolerates_missing_model():
+    """A missing spaCy model is logged rather than stopping the worker."""
+    with patch("src.pipeline.tier2.warmup", side_effect=RuntimeError("no model")):
+        await pipeline.warm_up_nlp()
+
+
 @pytest.mark.asyncio
 async def test_process_task_single_chunk(mock_task):
     """Test processing a single-chunk task."""
     with (
         patch("src.pipeline.api_client") as mock_api_client,
-        patch("src.pipeline.adapter") as mock_adapter,
+        _patch_adapter() as mock_adapter,
     ):
         # Mock API client operations
         mock_api_client.submit_result = AsyncMock()
@@ -95,6 +248,39 @@ async def test_process_task_single_chunk(mock_task):
         assert call_args[1]["collection"] == "docs"
 
 
+@pytest.mark.asyncio
+async def test_process_task_overlaps_tier2_with_llm_extraction(mock_task):
+    """Tier-2 extraction and document-level extraction run concurrently."""
+    both_started = asyncio.Event()
+    started = 0
+
+    async def wait_for_both(*args, **kwargs):
+        nonlocal started
+        started += 1
+        if started == 2:
+            both_started.set()
+        await asyncio.wait_for(both_started.wait(), timeout=1)
+
+    async def fake_tier2(text, document=None):
+        await wait_for_both()
+        return {"entities": [], "keywords": [], "language": "en"}
+
+    async def fake_tier3(*args):
+        await wait_for_both()
+        return {"tier3": {}, "entities": [], "relationships": [], "summary": ""}
+
+    with (
+        patch("src.pipeline.api_client") as mock_api_client,
+        patch("src.pipeline.run_tier2_extraction", fake_tier2),
+        patch("src.pipeline.run_document_level_extraction", fake_tier3),
+    ):
+        mock_api_client.submit_result = AsyncMock()
+
+        await process_task(mock_task)
+
+    assert mock_api_client.submit_result.call_args[1]["tier2"]["language"] == "en"
+
+
 @pytest.mark.asyncio
 async def test_process_task_multi_chunk_middle(mock_task):
     """Test processing a middle chunk of a multi-chunk document."""
@@ -130,7 +316,7 @@ async def test_process_task_multi_chunk_last(mock_task):
 
     with (
         patch("src.pipeline.api_client") as mock_api_client,
-        patch("src.pipeline.adapter") as mock_adapter,
+        _patch_adapter() as mock_adapter,
     ):
         # Mock API client operations
         mock_api_client.submit_result = AsyncMock()
@@ -170,7 +356,7 @@ async def test_process_task_handles_error(mock_task):
 @pytest.mark.asyncio
 async def test_run_document_level_extraction():
     """Test document-level extraction."""
-    with patch("src.pipeline.adapter") as mock_adapter:
+    with _patch_adapter() as mock_adapter:
         # Mock adapter responses
         mock_adapter.extract_metadata = AsyncMock(return_value={"summary": "Test"})
         mock_adapter.extract_entities = AsyncMock(
@@ -198,6 +384,59 @@ async def test_run_document_level_extraction():
         assert result["relationships"][0]["type"] == "uses"
 
 
+@pytest.mark.asyncio
+async def test_run_document_level_extraction_runs_llm_calls_concurrently():
+    """Metadata and entity extraction overlap, and one failing keeps the other."""
+    both_started = asyncio.Event()
+    started = 0
+
+    async def fake_call(*args):
+        nonlocal started
+        started += 1
+        if started == 2:
+            both_started.set()
+        await asyncio.wait_for(both_started.wait(), 1)
+
+    async def failing_metadata(*args):
+        await fake_call()
+        raise RuntimeError("metadata down")
+
+    async def entities(*args):
+        await fake_call()
+        return {"entities": [{"name": "A", "type": "org"}], "relationships": []}
+
+    with _patch_adapter() as mock_adapter:
+        mock_adapter.extract_metadata = failing_metadata
+        mock_adapter.extract_entities = entities
+
+        result = await run_document_level_extraction("base-id", "code", "text", 1, "test.py")
+
+    assert result["entities"][0]["name"] == "A"
+    assert result["summary"] == ""
+
+
+@pytest.mark.asyncio
+async def test_run_document_level_extraction_raises_when_both_llm_calls_fail():
+    """A document with no tier-3 output at all fails so the task is retried."""
+    with _patch_adapter() as mock_adapter:
+        mock_adapter.extract_metadata = AsyncMock(side_effect=RuntimeError("metadata down"))
+        mock_adapter.extract_entities = AsyncMock(side_effect=RuntimeError("entities down"))
+
+        with pytest.raises(RuntimeError, match="metadata down"):
+            await run_document_level_extraction("base-id", "code", "text", 1, "test.py")
+
+
+@pytest.mark.asyncio
+async def test_run_document_level_extraction_propagates_cancellation():
+    """Cancellation of either LLM call is not mistaken for a partial failure."""
+    with _patch_adapter() as mock_adapter:
+        mock_adapter.extract_metadata = AsyncMock(return_value={"summary": "Test"})
+        mock_adapter.extract_entities = AsyncMock(side_effect=asyncio.CancelledError())
+
+        with pytest.raises(asyncio.CancelledError):
+            await run_document_level_extraction("base-id", "code", "text", 1, "test.py")
+
+
 def test_normalize_tier3_metadata_summary_cascade():
     """Summary levels cascade from longer to shorter when missing."""
     meta = {"summary_long": "A long summary about the document."}
@@ -2,7 +2,7 @@
 
 import json
 
-from src.schemas import get_schema_for_doctype
+from src.schemas import get_json_schema_for_doctype, get_schema_for_doctype, schema_cache_key
 from src.schemas.article import ArticleMetadata
 from src.schemas.code import CodeMetadata
 from src.schemas.email import EmailMetadata
@@ -243,6 +243,20 @@ def test_schema_serialization():
         assert "properties" in json_schema or "type" in json_schema
 
 
+def test_json_schema_for_doctype_is_cached():
+    """JSON schemas are serialized once per doc type and handed out as copies."""
+    from src.schemas.code import CodeMetadata
+
+    schema, prompt, schema_json = get_json_schema_for_doctype("code")
+
+    assert schema == CodeMetadata.model_json_schema()
+    assert prompt == get_schema_for_doctype("code")[1]
+    assert get_json_schema_for_doctype("code")[2] is schema_json
+
+    schema["properties"].clear()
+    assert get_json_schema_for_doctype("code")[0] == CodeMetadata.model_json_schema()
+
+
 def test_text_schema_explicit():
     """Test that 'text' doc type returns TextMetadata explicitly."""
     from src.schemas.text import TextMetadata
@@ -332,3 +346,12 @@ def test_schemas_have_summary_fields():
         assert hasattr(instance, "summary_long"), f"{cls.__name__} missing summary_long"
         assert hasattr(instance, "keywords"), f"{cls.__name__} missing keywords"
         assert isinstance(instance.keywords, list), f"{cls.__name__}.keywords must be a list"
+
+
+def test_schema_cache_key_is_canonical():
+    """Test the registry key matches schema_cache_key regardless of key order."""
+    schema, _, schema_json = get_json_schema_for_doctype("code")
+
+    assert schema_cache_key(schema) == schema_json
+    assert schema_cache_key(dict(reversed(list(schema.items())))) == schema_json
+    assert json.loads(schema_json) == schema
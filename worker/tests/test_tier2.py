@@ -1,12 +1,17 @@
 """Tests for tier-2 NLP extraction."""
 
+from unittest.mock import MagicMock, patch
+
 import pytest
 
+from src import tier2
 from src.tier2 import (
     detect_language,
     extract_entities,
     extract_keywords,
     process_text_nlp,
+    process_texts_nlp_batch,
+    warmup,
 )
 
 
@@ -102,6 +107,12 @@ def test_detect_language_empty():
     assert detect_language("   ") == "unknown"
 
 
+def test_detect_language_uses_leading_sample():
+    """Test only the start of a long text is used for language detection."""
+    text = "This is an English sentence about software. " * 30 + "Ceci est du français. " * 500
+    assert detect_language(text) == "en"
+
+
 def test_detect_language_short():
     """Test language detection with very short text."""
     # Short text might not be reliably detected, but should not crash
@@ -133,8 +144,86 @@ def test_process_text_nlp():
     assert len(result["keywords"]) > 0
 
 
+@requires_spacy_model
+def test_process_texts_nlp_batch_matches_single_pass():
+    """Test batched NLP returns the per-text results in order, skipping blank texts."""
+    texts = ["Apple Inc. was founded by Steve Jobs.", "", "Microsoft is based in Redmond."]
+
+    results = process_texts_nlp_batch(texts, batch_size=2)
+
+    assert results == [process_text_nlp(text) for text in texts]
+    assert results[1] == {"entities": [], "keywords": []}
+
+
+def test_process_texts_nlp_batch_blank_texts():
+    """Test blank texts need no spaCy model."""
+    assert process_texts_nlp_batch(["", "  "]) == [
+        {"entities": [], "keywords": []},
+        {"entities": [], "keywords": []},
+    ]
+
+
+def test_process_texts_nlp_batch_passes_n_process():
+    """Test batch_size and n_process go straight to nlp.pipe."""
+    nlp = MagicMock()
+    nlp.pipe.return_value = [MagicMock(ents=[])]
+
+    with patch("src.tier2._get_nlp", return_value=nlp):
+        process_texts_nlp_batch(["text"], batch_size=4, n_process=3)
+
+    assert nlp.pipe.call_args.kwargs == {"batch_size": 4, "n_process": 3, "disable": []}
+
+
+def test_extract_entities_runs_only_ner_components():
+    """Test entity-only extraction skips the components that only feed keywords."""
+    nlp = MagicMock()
+    nlp.pipe_names = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner"]
+    ent = MagicMock(text="Apple", label_="ORG")
+    nlp.pipe.return_value = [MagicMock(ents=[ent])]
+
+    with patch("src.tier2._get_nlp", return_value=nlp):
+        entities = extract_entities("Apple makes phones.")
+
+    assert entities == [{"text": "Apple", "label": "ORG"}]
+    assert nlp.pipe.call_args.kwargs["disable"] == [
+        "tagger",
+        "parser",
+        "attribute_ruler",
+        "lemmatizer",
+    ]
+
+
 @requires_spacy_model
 def test_process_text_nlp_empty():
     """Test process_text_nlp with empty text."""
     result = process_text_nlp("")
     assert result == {"entities": [], "keywords": []}
+
+
+def test_warmup_runs_a_text_through_the_pipeline():
+    """Test warmup loads spaCy and processes one text with every component."""
+    nlp = MagicMock()
+    nlp.pipe.return_value = [MagicMock(ents=[])]
+
+    with patch("src.tier2._get_nlp", return_value=nlp):
+        warmup()
+
+    assert nlp.pipe.call_count == 1
+    assert nlp.pipe.call_args.kwargs["disable"] == []
+
+
+def test_get_nlp_prefers_gpu_when_enabled():
+    """Test NLP_GPU asks spaCy for a GPU before loading, and falls back to CPU."""
+    fake_spacy = MagicMock()
+    fake_spacy.prefer_gpu.return_value = False
+    fake_spacy.load.return_value.pipe_names = ["textrank"]
+
+    with (
+        patch("src.tier2.NLP_GPU", True),
+        patch("src.tier2.spacy", fake_spacy),
+        patch("src.tier2._nlp", None),
+    ):
+        nlp = tier2._get_nlp()
+
+    assert nlp is fake_spacy.load.return_value
+    fake_spacy.prefer_gpu.assert_called_once_with()